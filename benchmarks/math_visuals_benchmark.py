@@ -0,0 +1,169 @@
+"""
+Measure math question draws/sec (figure drawn on the Agg canvas) and renders/sec
+(drawn and encoded as PNG) of tools/create_math_visuals.py: sprites decoded on
+every draw and drawn one imshow per copy (the old behaviour), decoded once per
+path, and decoded once and tiled into a single imshow.
+
+--soak N renders N questions back to back in a fresh process per renderer mode
+and reports the resident set size along the way: 'reuse' redraws one figure,
+'fresh' builds a figure per render, and 'pyplot' creates figures with pyplot
+and never closes them like the Lambda used to (opt in, it grows without bound).
+
+Usage (from the repository root):
+    python benchmarks/math_visuals_benchmark.py
+    python benchmarks/math_visuals_benchmark.py --renders 500 --sprite image/banana.png
+    python benchmarks/math_visuals_benchmark.py --soak 10000
+    python benchmarks/math_visuals_benchmark.py --soak 1000 --soak-modes reuse fresh pyplot
+"""
+
+import argparse
+import importlib.util
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+VISUALS_FILE = os.path.join(os.path.dirname(__file__), '..', 'tools', 'create_math_visuals.py')
+
+# (name, sprite decode cache, composite mode)
+VARIANTS = (
+    ('decode per draw, each', False, 'each'),
+    ('decode cached, each', True, 'each'),
+    ('decode cached, tile', True, 'tile'),
+)
+
+
+def load_visuals_module(sprite_file):
+    spec = importlib.util.spec_from_file_location('create_math_visuals', VISUALS_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.SPRITE_IMAGES = dict.fromkeys(module.SPRITE_IMAGES, sprite_file)
+    return module
+
+
+def draw_canvas(module, operation, number_a, number_b):
+    renderer = module.get_renderer()
+    fig = renderer.figure(module.math_question_figsize(number_a, number_b))
+    module.draw_math_question(fig, operation, number_a, number_b)
+    fig.canvas.draw()
+    renderer.release(fig)
+
+
+def render_png(module, operation, number_a, number_b):
+    return module.get_renderer().render_png(module.math_question_figsize(number_a, number_b),
+                                            module.draw_math_question, operation, number_a, number_b)
+
+
+def render_png_pyplot(module, operation, number_a, number_b):
+    import matplotlib.pyplot as plt
+    fig = plt.figure(figsize=module.math_question_figsize(number_a, number_b))
+    module.draw_math_question(fig, operation, number_a, number_b)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')  # never closed, as before the FigureRenderer
+    return buffer.getvalue()
+
+
+def per_second(module, render, questions, renders, cached):
+    start = time.perf_counter()
+    for i in range(renders):
+        if not cached:
+            module._sprites.clear()
+        render(module, *questions[i % len(questions)])
+    return renders / (time.perf_counter() - start)
+
+
+def run_benchmark(sprite_file, renders=200):
+    module = load_visuals_module(sprite_file)
+    questions = list(module.math_question_space())
+    results = {}
+    for name, cached, composite in VARIANTS:
+        module.SPRITE_COMPOSITE = composite
+        module._sprites.clear()
+        render_png(module, *questions[0])  # warm up fonts and the Agg canvas
+        results[name] = (per_second(module, draw_canvas, questions, renders, cached),
+                         per_second(module, render_png, questions, renders, cached))
+    return results
+
+
+def rss_mib():
+    """Current resident set size from /proc (Linux), or the peak where /proc is missing."""
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mib()
+
+
+def peak_rss_mib():
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_soak(sprite_file, renders, mode):
+    """Render `renders` questions with one renderer mode; returns renders/sec and RSS in MiB at every tenth."""
+    module = load_visuals_module(sprite_file)
+    module._renderer = module.FigureRenderer(reuse=mode == 'reuse')
+    render = render_png_pyplot if mode == 'pyplot' else render_png
+    questions = list(module.math_question_space())
+    render(module, *questions[0])
+    checkpoints, step = {0: rss_mib()}, max(1, renders // 10)
+    start = time.perf_counter()
+    for i in range(1, renders + 1):
+        render(module, *questions[i % len(questions)])
+        if i % step == 0 or i == renders:
+            checkpoints[i] = rss_mib()
+    return {'renders/sec': renders / (time.perf_counter() - start), 'rss': checkpoints,
+            'peak rss': peak_rss_mib()}
+
+
+def print_soak(mode, result):
+    rss = result['rss']
+    first, last = min(rss), max(rss)
+    print(f"{mode:<8}{result['renders/sec']:>14,.1f}{rss[first]:>12.1f}{rss[last]:>12.1f}"
+          f"{result['peak rss']:>12.1f}  " + ' '.join(f"{value:.0f}" for value in rss.values()))
+
+
+def print_report(results):
+    draws_baseline, renders_baseline = next(iter(results.values()))
+    print(f"{'variant':<26}{'draws/sec':>12}{'speedup':>10}{'renders/sec':>14}{'speedup':>10}")
+    for name, (draws, renders) in results.items():
+        print(f"{name:<26}{draws:>12,.1f}{draws / draws_baseline:>9.2f}x"
+              f"{renders:>14,.1f}{renders / renders_baseline:>9.2f}x")
+    # ru_maxrss is reported in KiB on Linux
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark math question rendering.')
+    parser.add_argument('--renders', type=int, default=200)
+    parser.add_argument('--sprite', default='image/banana.png', help='sprite image to draw the numbers with')
+    parser.add_argument('--soak', type=int, default=0, metavar='N',
+                        help='render N questions in a fresh process per renderer mode and report RSS')
+    parser.add_argument('--soak-modes', nargs='+', default=['reuse', 'fresh'], choices=['reuse', 'fresh', 'pyplot'])
+    parser.add_argument('--soak-child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sprite_file = os.path.abspath(args.sprite)
+    if args.soak_child:
+        print(json.dumps(run_soak(sprite_file, args.soak, args.soak_child)))
+    elif args.soak:
+        print(f"{'mode':<8}{'renders/sec':>14}{'start MiB':>12}{'end MiB':>12}{'peak MiB':>12}  RSS MiB every "
+              f"{max(1, args.soak // 10)} renders")
+        for mode in args.soak_modes:
+            output = subprocess.run([sys.executable, __file__, '--soak', str(args.soak), '--soak-child', mode,
+                                     '--sprite', sprite_file], check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.splitlines()[-1])
+            result['rss'] = {int(renders): value for renders, value in result['rss'].items()}
+            print_soak(mode, result)
+    else:
+        print_report(run_benchmark(sprite_file, args.renders))
+
+
+if __name__ == '__main__':
+    main()
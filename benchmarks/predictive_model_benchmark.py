@@ -0,0 +1,169 @@
+"""
+Measure model build time, single and batch predictions/sec and cold-start
+latency of the student success model in tools/student_predictive_model.py
+against an academic database.
+
+Usage (from the repository root):
+    python -m utils.synthetic_academic_data --students 50000 --years 10 --out-dir /tmp/synthetic
+    python benchmarks/predictive_model_benchmark.py --db /tmp/synthetic/porterville_academic.db
+    python benchmarks/predictive_model_benchmark.py --db /tmp/synthetic/porterville_academic.db --artifact /tmp/synthetic/student_success_model.bin
+    python benchmarks/predictive_model_benchmark.py --db /tmp/synthetic/porterville_academic.db --artifact /tmp/synthetic/student_success_model.bin --cold-start 20
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+
+MODEL_FILE = os.path.join(os.path.dirname(__file__), '..', 'tools', 'student_predictive_model.py')
+
+
+def load_model_module(db_file, artifact_file=None):
+    """Import the Lambda module; without artifact_file the model is built from student_data."""
+    os.environ['ACADEMIC_DB_FILE'] = db_file
+    os.environ['MODEL_ARTIFACT_FILE'] = artifact_file or os.path.join(os.path.dirname(db_file), 'no_model_artifact')
+    spec = importlib.util.spec_from_file_location('student_predictive_model', MODEL_FILE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def sample_pairs(db_file, count, seed):
+    """Draw (student_id, course_code) pairs from the database."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_file)
+    try:
+        students = [row[0] for row in conn.execute('SELECT DISTINCT student_id FROM student_data')]
+        courses = [row[0] for row in conn.execute('SELECT DISTINCT course_code FROM course_schedule')]
+    finally:
+        conn.close()
+    return [(rng.choice(students), rng.choice(courses)) for _ in range(count)]
+
+
+def run_benchmark(db_file, predictions=20000, seed=7, artifact_file=None):
+    module = load_model_module(db_file, artifact_file)
+    pairs = sample_pairs(db_file, predictions, seed)
+    results = {}
+
+    if artifact_file and not os.path.exists(artifact_file):
+        start = time.perf_counter()
+        module.build_feature_store(db_file, artifact_file)
+        results['artifact build ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        module.get_model()
+    results['model load ms' if artifact_file else 'model build ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for student_id, course_code in pairs:
+        module.predict_student_success(course_code, student_id)
+    results['predictions/sec'] = len(pairs) / (time.perf_counter() - start)
+
+    # One ranked batch per student over every course offered in the latest term
+    conn = sqlite3.connect(db_file)
+    term = conn.execute('SELECT max(term) FROM course_schedule').fetchone()[0]
+    conn.close()
+    students = list(dict.fromkeys(student_id for student_id, _ in pairs))[:1000]
+    scored = 0
+    start = time.perf_counter()
+    for student_id in students:
+        scored += module.predict_student_success_batch(student_id, term=term)['candidates']
+    elapsed = time.perf_counter() - start
+    results['batch calls/sec'] = len(students) / elapsed
+    results['batch scored/sec'] = scored / elapsed
+
+    event = {
+        'agent': {}, 'actionGroup': 'PredictionActionGroup', 'function': 'predict_student_success',
+        'messageVersion': '1.0', 'parameters': [
+            {'name': 'course_id', 'value': pairs[0][1]}, {'name': 'student_id', 'value': pairs[0][0]},
+        ],
+    }
+    calls = min(len(pairs), 2000)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(calls):
+            module.lambda_handler(event, None)
+    results['handler calls/sec'] = calls / (time.perf_counter() - start)
+    return results
+
+
+# Run in a fresh interpreter per sample: import the Lambda module, then time its first invocation
+COLD_START_SCRIPT = """
+import contextlib, importlib.util, io, json, sys, time
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('student_predictive_model', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    module.lambda_handler(json.loads(sys.argv[2]), None)
+print(json.dumps({'import ms': (imported - start) * 1000, 'first call ms': (time.perf_counter() - imported) * 1000,
+                  **{k: v for k, v in module._cold_start.items() if k.endswith('_ms')}}))
+"""
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_cold_start(db_file, artifact_file, samples, seed=7):
+    """Time import and first predict_student_success call in `samples` fresh processes; returns {name: [ms]}."""
+    student_id, course_code = sample_pairs(db_file, 1, seed)[0]
+    event = json.dumps({
+        'agent': {}, 'actionGroup': 'PredictionActionGroup', 'function': 'predict_student_success',
+        'messageVersion': '1.0', 'parameters': [
+            {'name': 'course_id', 'value': course_code}, {'name': 'student_id', 'value': student_id},
+        ],
+    })
+    environment = dict(os.environ, ACADEMIC_DB_FILE=db_file, MODEL_ARTIFACT_FILE=artifact_file or os.path.join(
+        os.path.dirname(db_file), 'no_model_artifact'))
+    timings = {}
+    for _ in range(samples):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, MODEL_FILE, event], env=environment,
+                                check=True, capture_output=True, text=True).stdout
+        for name, value in json.loads(output.splitlines()[-1]).items():
+            timings.setdefault(name, []).append(value)
+    return timings
+
+
+def print_cold_start(timings):
+    print(f"{'cold start':<22}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, values in timings.items():
+        print(f"{name:<22}{percentile(values, 0.5):>10.2f}{percentile(values, 0.95):>10.2f}{max(values):>10.2f}")
+
+
+def print_report(results):
+    for name, value in results.items():
+        print(f"{name:<20}{value:>14,.1f}")
+    # ru_maxrss is reported in KiB on Linux
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the student success model.')
+    parser.add_argument('--db', default='porterville_academic.db')
+    parser.add_argument('--predictions', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--artifact', default=None, help='model artifact to load (built first if missing)')
+    parser.add_argument('--cold-start', type=int, default=0, metavar='N',
+                        help='also time import and first prediction in N fresh processes')
+    args = parser.parse_args()
+    db_file = os.path.abspath(args.db)
+    artifact_file = os.path.abspath(args.artifact) if args.artifact else None
+    print_report(run_benchmark(db_file, args.predictions, args.seed, artifact_file))
+    if args.cold_start:
+        print_cold_start(run_cold_start(db_file, artifact_file, args.cold_start, args.seed))
+
+
+if __name__ == '__main__':
+    main()
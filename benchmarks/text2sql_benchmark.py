@@ -0,0 +1,169 @@
+"""
+Replay a corpus of representative agent SQL against the text2sql Lambda's
+lambda_handler locally and report p50/p95 latency, peak RSS and result size.
+
+Usage (from the repository root):
+    python -m utils.synthetic_academic_data --students 50000 --years 10 --out-dir /tmp/synthetic
+    python benchmarks/text2sql_benchmark.py --db /tmp/synthetic/porterville_academic.db
+    python benchmarks/text2sql_benchmark.py --db /tmp/synthetic/porterville_academic.db --compare-scope
+
+Student scoping is not free: the per-student views make each statement a little
+more work to compile and the scope authorizer is consulted for every column the
+views expose. On a 20k-student synthetic database that is about 0.03-0.09 ms per
+call at p50, 1.1-1.7x on indexed single-student lookups depending on the run;
+--compare-scope prints the overhead of each query.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import os
+import random
+import resource
+import sqlite3
+import time
+
+LAMBDA_FILE = os.path.join(os.path.dirname(__file__), '..', 'tools', 'text2sql_lambda_function-porterville.py')
+
+# Representative agent questions, parameterized with values sampled from the database.
+QUERY_CORPUS = {
+    'student_history': "SELECT course_code, term, grade, credits FROM student_data WHERE student_id = '{student_id}'",
+    'student_credits': "SELECT SUM(credits) FROM student_data WHERE student_id = '{student_id}' AND grade NOT IN ('F', 'W')",
+    'student_major': "SELECT DISTINCT major FROM student_data WHERE student_id = '{student_id}'",
+    'current_schedule': "SELECT course_code, class_days, class_start_time, class_end_time FROM student_schedule "
+                        "WHERE student_id = '{student_id}' AND term = {term}",
+    'course_offerings': "SELECT * FROM course_schedule WHERE course_code = '{course_code}' AND term = {term}",
+    'term_offerings': "SELECT course_code, print_daytime FROM course_schedule WHERE term = {term}",
+    'subject_offerings': "SELECT course_code, print_daytime FROM course_schedule "
+                         "WHERE term = {term} AND course_code LIKE '{subject}%'",
+    'course_pass_rate': "SELECT AVG(grade IN ('A', 'A-', 'B+', 'B', 'B-', 'C+', 'C')) FROM student_data "
+                        "WHERE course_code = '{course_code}'",
+    'major_gpa': "SELECT major, COUNT(DISTINCT student_id) FROM student_data GROUP BY major",
+    'unfiltered_history': "SELECT * FROM student_data",
+}
+
+
+def load_lambda(db_file, environment):
+    """Import the Lambda module against db_file with the given environment overrides."""
+    os.environ['ACADEMIC_DB_FILE'] = db_file
+    os.environ.update(environment)
+    spec = importlib.util.spec_from_file_location('text2sql_lambda', LAMBDA_FILE)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    return module
+
+
+def make_event(function, session_attributes=None, **parameters):
+    event = {
+        'agent': {}, 'actionGroup': 'Text2SqlActionGroup', 'function': function, 'messageVersion': '1.0',
+        'parameters': [{'name': name, 'value': value} for name, value in parameters.items()],
+    }
+    if session_attributes:
+        event['sessionAttributes'] = session_attributes
+    return event
+
+
+def invoke(module, event):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        response = module.lambda_handler(event, None)
+        elapsed = time.perf_counter() - start
+    return elapsed, response['response']['functionResponse']['responseBody']['TEXT']['body']
+
+
+def sample_values(db_file, count, seed):
+    """Draw realistic (student, term, course) parameters from the database."""
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_file)
+    try:
+        students = [row[0] for row in conn.execute('SELECT DISTINCT student_id FROM student_schedule')]
+        term = conn.execute('SELECT max(term) FROM course_schedule').fetchone()[0]
+        courses = [row[0] for row in conn.execute('SELECT DISTINCT course_code FROM course_schedule WHERE term = ?', (term,))]
+    finally:
+        conn.close()
+    return [{
+        'student_id': rng.choice(students),
+        'term': term,
+        'course_code': course_code,
+        'subject': course_code.split(' ')[0],
+    } for course_code in (rng.choice(courses) for _ in range(count))]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_benchmark(db_file, iterations=200, seed=7, environment=None, scoped=False):
+    """
+    Time get_schema and every query of the corpus. With scoped=True each call is made
+    in a session scoped to the sampled student, as a student-facing agent would.
+    """
+    module = load_lambda(db_file, environment or {})
+    parameters = sample_values(db_file, iterations, seed)
+    results = {}
+
+    timings, sizes = [], []
+    for _ in range(max(1, iterations // 10)):
+        elapsed, body = invoke(module, make_event('get_schema'))
+        timings.append(elapsed)
+        sizes.append(len(body))
+    results['get_schema'] = (timings, sizes)
+
+    for name, template in QUERY_CORPUS.items():
+        timings, sizes = [], []
+        for values in parameters:
+            session_attributes = {'student_id': values['student_id']} if scoped else None
+            event = make_event('sql_query', session_attributes, query=template.format(**values))
+            elapsed, body = invoke(module, event)
+            timings.append(elapsed)
+            sizes.append(len(body.encode('utf-8')))
+        results[name] = (timings, sizes)
+    if scoped and module.scoped_db.get().in_transaction:
+        # An open transaction would pin a stale read snapshot and hold a SHARED lock
+        raise RuntimeError('the student-scoped connection kept a transaction open after a query')
+    return results
+
+
+def print_report(results):
+    print(f"{'query':<22}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'mean bytes':>12}{'max bytes':>11}")
+    for name, (timings, sizes) in results.items():
+        print(f"{name:<22}{len(timings):>7}{percentile(timings, 0.5) * 1000:>10.2f}"
+              f"{percentile(timings, 0.95) * 1000:>10.2f}{sum(sizes) / len(sizes):>12.0f}{max(sizes):>11}")
+    # ru_maxrss is reported in KiB on Linux
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+def print_scope_comparison(unscoped, scoped):
+    """Compare p50/p95 latency of the same corpus with and without student scoping."""
+    print(f"{'query':<22}{'p50 ms':>10}{'scoped':>10}{'overhead':>10}{'p95 ms':>10}{'scoped':>10}")
+    for name, (timings, _) in unscoped.items():
+        scoped_timings = scoped[name][0]
+        p50, scoped_p50 = percentile(timings, 0.5), percentile(scoped_timings, 0.5)
+        print(f"{name:<22}{p50 * 1000:>10.2f}{scoped_p50 * 1000:>10.2f}{scoped_p50 / p50:>9.2f}x"
+              f"{percentile(timings, 0.95) * 1000:>10.2f}{percentile(scoped_timings, 0.95) * 1000:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the text2sql Lambda against an academic database.')
+    parser.add_argument('--db', default='porterville_academic.db')
+    parser.add_argument('--iterations', type=int, default=200, help='calls per query in the corpus')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-cache', action='store_true', help='disable the query result cache')
+    parser.add_argument('--compare-scope', action='store_true',
+                        help='compare unscoped and student-scoped sessions (implies --no-cache)')
+    args = parser.parse_args()
+    environment = {'QUERY_CACHE_SIZE': '0'} if args.no_cache or args.compare_scope else {}
+    db_file = os.path.abspath(args.db)
+    if args.compare_scope:
+        unscoped = run_benchmark(db_file, args.iterations, args.seed, environment)
+        scoped = run_benchmark(db_file, args.iterations, args.seed, environment, scoped=True)
+        print_scope_comparison(unscoped, scoped)
+    else:
+        print_report(run_benchmark(db_file, args.iterations, args.seed, environment))
+
+
+if __name__ == '__main__':
+    main()
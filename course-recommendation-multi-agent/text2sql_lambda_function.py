@@ -1,70 +1,299 @@
+import difflib
 import json
 import sqlite3
 import os
+import re
 import shutil
+import threading
+import time
 from datetime import datetime
 
-original_db_file = 'porterville_academic.db'
+original_db_file = os.environ.get('ACADEMIC_DB_FILE', 'porterville_academic.db')
 target_db_file = '/tmp/porterville_academic.db'
-if not os.path.exists(target_db_file):
-    shutil.copy2(original_db_file, target_db_file)
-        
-def lambda_handler(event, context):
-    agent = event['agent']
-    actionGroup = event['actionGroup']
-    function = event['function']
-    parameters = event.get('parameters', [])
-    body_text=''
-    if function == 'get_schema':
-        body_text="""
-Table Name 'student_schedule':
-(Column Name, 'student_id', 'TEXT')
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'print_daytime', 'TEXT')
-(Column Name, 'building_number', 'TEXT')
-(Column Name, 'room_number', 'TEXT')
-(Column Name, 'class_days', 'TEXT')
-(Column Name, 'class_start_time', 'REAL')
-(Column Name, 'class_end_time', 'REAL')
 
-<examples>
-Question: Show me the class days for student testuserb to take the BIOE221 course.
-Query: SELECT class_days FROM student_schedule
-WHERE student_id = 'testuserb' AND course_code = 'BIOE221';
-</examples>
+# 'immutable' opens the packaged database in place (read-only, memory-mapped,
+# no locking); 'copy' copies it to /tmp first for workloads that need writes.
+DB_OPEN_MODE = os.environ.get('DB_OPEN_MODE', 'immutable')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AcademicAgent/Text2Sql')
+
+# Bookkeeping tables maintained by utils.academic_db that agents never need to query
+SCHEMA_HIDDEN_TABLES = {'ingest_watermark', 'academic_data_version', 'student_summary_course'}
+SCHEMA_SAMPLE_VALUES = int(os.environ.get('SCHEMA_SAMPLE_VALUES', 5))
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', 256))
+VALIDATION_MODES = ('dry_run', 'execute')
+
+_MISSING_OBJECT = re.compile(r'no such (table|column): (?:\w+\.)?(\w+)')
+# Table (or alias) and index named by an EXPLAIN QUERY PLAN step
+_PLAN_OBJECT = re.compile(r'^(?:SCAN|SEARCH) (\S+)')
+_PLAN_INDEX = re.compile(r'\bINDEX (\w+)')
+
+# Per-connection tuning, overridable through the Lambda environment.
+# cache_size is negative so SQLite reads it as KiB rather than pages.
+DB_PRAGMAS = {
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
 
---------------------------------------------------------
+def emit_metric(name, value, unit='Milliseconds', **dimensions):
+    """Print a metric in CloudWatch Embedded Metric Format."""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit}],
+            }],
+        },
+        name: value,
+        **dimensions,
+    }))
 
-Table Name 'course_schedule':
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'print_daytime', 'TEXT')
-(Column Name, 'building_number', 'TEXT')
-(Column Name, 'room_number', 'TEXT')
-(Column Name, 'class_days', 'TEXT')
-(Column Name, 'class_start_time', 'REAL')
-(Column Name, 'class_end_time', 'REAL')
 
---------------------------------------------------------
+# ConnectionManager and the schema introspection below (from _schema_cache to
+# load_schema) are kept identical in tools/text2sql_lambda_function-porterville.py:
+# each Lambda is packaged as a single file, so change both copies together.
+class ConnectionManager:
+    """
+    Keeps one SQLite connection alive across warm Lambda invocations.
 
-Table Name 'student_data':
-(Column Name, 'student_id', 'INTEGER')
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'credits', 'REAL')
-(Column Name, 'grade', 'TEXT')
-(Column Name, 'major', 'TEXT')
+    The connection is opened lazily, tuned with DB_PRAGMAS, and re-validated
+    with a trivial statement before it is handed out, so a broken connection
+    is transparently replaced instead of failing the agent turn.
+    """
+
+    def __init__(self, db_file, pragmas=None, readonly=True, immutable=False, setup=None):
+        self.db_file = db_file
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self.readonly = readonly
+        self.immutable = immutable
+        # Optional callable run on every new connection, e.g. to create temp views
+        self.setup = setup
+        self._conn = None
+
+    def _connect(self):
+        uri = f'file:{os.path.abspath(self.db_file)}?mode={"ro" if self.readonly else "rw"}'
+        if self.immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.setup is not None:
+            self.setup(conn)
+        return conn
+
+    def get(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                self.close()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+
+def open_database():
+    """Open the academic database according to DB_OPEN_MODE and report how long it took."""
+    start = time.perf_counter()
+    if DB_OPEN_MODE == 'copy':
+        if not os.path.exists(target_db_file):
+            shutil.copy2(original_db_file, target_db_file)
+        manager = ConnectionManager(target_db_file, readonly=False)
+    elif DB_OPEN_MODE == 'immutable':
+        manager = ConnectionManager(original_db_file, immutable=True)
+    else:
+        raise ValueError("Invalid DB_OPEN_MODE. Choose either 'immutable' or 'copy'.")
+    manager.get()
+    emit_metric('ColdStartDbReadyMs', (time.perf_counter() - start) * 1000, DbOpenMode=DB_OPEN_MODE)
+    return manager
+
+
+db = open_database()
+
+
+def data_version_token(conn, db_file):
+    """Cheap token that changes whenever the database content may have changed."""
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    # Bumped by utils.academic_db on every rebuild or incremental ingest
+    try:
+        ingest_version = conn.execute('SELECT version FROM academic_data_version').fetchone()[0]
+    except sqlite3.OperationalError:
+        ingest_version = None
+    stat = os.stat(db_file)
+    return (data_version, ingest_version, stat.st_mtime_ns, stat.st_size)
+
+
+SCHEMA_GUIDANCE = """
+<examples>
+Question: Show me the class days for student 1 to take the BIOL P110 course.
+Query: SELECT class_days FROM student_schedule
+WHERE student_id = '001' AND course_code = 'BIOL P110';
+</examples>
 
 <query-principle>
 1. Don't make up column names.
+2. Match the column types and value formats shown in the sample values (e.g. student_id '001', class_start_time 900 means 9:00am).
+3. Filter on indexed columns where possible so lookups stay selective.
 </query-principle>
 """
+
+_schema_cache = {'version': None, 'schema': None, 'text': None}
+# Batch queries may load the schema on several threads
+_schema_lock = threading.Lock()
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def introspect_schema(conn):
+    """
+    Describe every user table from sqlite_master: columns, indexes, approximate size and sample values.
+    Everything is read from the main schema so per-student views never skew the description.
+    """
+    schema = {}
+    tables = conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    for (table,) in tables:
+        if table in SCHEMA_HIDDEN_TABLES:
+            continue
+        columns = [(row[1], row[2] or 'ANY') for row in conn.execute(f'PRAGMA main.table_info({_quote(table)})')]
+        indexes = []
+        for _, index_name, unique, *_ in conn.execute(f'PRAGMA main.index_list({_quote(table)})'):
+            # Expression columns (e.g. ifnull(class_days, '') in a natural key index) have no name
+            index_columns = [row[2] or '<expression>'
+                             for row in conn.execute(f'PRAGMA main.index_info({_quote(index_name)})')]
+            indexes.append((index_name, index_columns, bool(unique)))
+        # max(rowid) is an O(log n) stand-in for count(*) on append-only tables
+        try:
+            row_count = conn.execute(f'SELECT max(rowid) FROM main.{_quote(table)}').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            row_count = conn.execute(f'SELECT count(*) FROM main.{_quote(table)}').fetchone()[0]
+        samples = {}
+        for column, column_type in columns:
+            # Binary columns (e.g. the passed-course bitmap) have no readable sample values
+            if column_type == 'BLOB':
+                samples[column] = []
+                continue
+            samples[column] = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT {_quote(column)} FROM main.{_quote(table)} '
+                f'WHERE {_quote(column)} IS NOT NULL LIMIT {SCHEMA_SAMPLE_VALUES}'
+            )]
+        schema[table] = {'columns': columns, 'indexes': indexes, 'row_count': row_count, 'samples': samples}
+    return schema
+
+
+def render_schema(schema):
+    sections = []
+    for table, info in schema.items():
+        lines = [f"Table Name '{table}' (~{info['row_count']} rows):"]
+        for column, column_type in info['columns']:
+            sample = ', '.join(repr(value) for value in info['samples'][column])
+            lines.append(f"(Column Name, '{column}', '{column_type}'" + (f", e.g. {sample})" if sample else ')'))
+        if info['indexes']:
+            lines.append('Indexes:')
+            for index_name, index_columns, unique in info['indexes']:
+                lines.append(f"({'UNIQUE ' if unique else ''}Index, '{index_name}', ({', '.join(index_columns)}))")
+        sections.append('\n'.join(lines))
+    return '\n\n--------------------------------------------------------\n\n'.join(sections) + '\n' + SCHEMA_GUIDANCE
+
+
+def load_schema(conn):
+    """Return the introspected schema, rebuilding it only when the data version changes."""
+    version = data_version_token(conn, db.db_file)
+    with _schema_lock:
+        if _schema_cache['version'] != version:
+            schema = introspect_schema(conn)
+            _schema_cache.update(version=version, schema=schema, text=render_schema(schema))
+        return _schema_cache['schema']
+
+
+def get_schema_description(conn):
+    load_schema(conn)
+    return _schema_cache['text']
+
+
+
+def validate_sql(conn, query):
+    """
+    Dry-run validation: compile the statement with EXPLAIN QUERY PLAN, which prepares
+    it without stepping through any data, and check it against the cached schema.
+    Returns JSON with either the error (plus close matches for unknown tables or
+    columns) or the estimated plan and the tables it reads.
+    """
+    schema = load_schema(conn)
+    start = time.perf_counter()
+    try:
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query)]
+    except (sqlite3.Error, sqlite3.Warning) as e:
+        result = {'valid': False, 'error': str(e)}
+        missing = _MISSING_OBJECT.search(str(e))
+        if missing:
+            kind, name = missing.groups()
+            if kind == 'table':
+                candidates = list(schema)
+            else:
+                candidates = {column for info in schema.values() for column, _ in info['columns']}
+            result['did_you_mean'] = difflib.get_close_matches(name, candidates, n=3, cutoff=0.5)
+        result['elapsed_us'] = round((time.perf_counter() - start) * 1e6)
+        return json.dumps(result)
+    return json.dumps({'valid': True, 'plan': plan, 'tables': plan_tables(plan, schema, query),
+                       'elapsed_us': round((time.perf_counter() - start) * 1e6)})
+
+
+def plan_tables(plan, schema, query):
+    """
+    Tables the query plan reads, in plan order. A step names a table, the alias it
+    was given in the query, or a CTE or subquery; steps that use an index are
+    resolved through the index, aliases through the FROM clause, and names that are
+    neither a table nor an alias of one (CTEs, subqueries) are left out.
+    """
+    tables_by_name = {table.lower(): table for table in schema}
+    index_tables = {index_name: table for table, info in schema.items() for index_name, _, _ in info['indexes']}
+    tables = []
+    for detail in plan:
+        index = _PLAN_INDEX.search(detail)
+        table = index_tables.get(index.group(1)) if index else None
+        step = _PLAN_OBJECT.match(detail)
+        if table is None and step:
+            name = step.group(1)
+            table = tables_by_name.get(name.lower()) or next(
+                (table for table in schema
+                 if re.search(rf'\b{re.escape(table)}\s+(?:AS\s+)?{re.escape(name)}\b', query, re.IGNORECASE)),
+                None)
+        if table is not None and table not in tables:
+            tables.append(table)
+    return tables
+
+
+def lambda_handler(event, context):
+    agent = event['agent']
+    actionGroup = event['actionGroup']
+    function = event['function']
+    parameters = event.get('parameters', [])
+    body_text=''
+    if function == 'get_schema':
+        body_text = get_schema_description(db.get())
     elif function == 'sql_validation':
         query = None
+        mode = 'dry_run'
         for param in parameters:
             if param["name"] == "query":
                 query = param["value"]
+            if param["name"] == "mode":
+                mode = param["value"]
 
         if not query:
             raise Exception("Missing mandatory parameter: query")
@@ -80,28 +309,35 @@ Table Name 'student_data':
 #             else
 #                 query += f' where student_id={student_id}'
         
-        conn = sqlite3.connect('/tmp/porterville_academic.db')
+        # Reuse the warm connection kept alive by the connection manager
+        conn = db.get()
 
-        # Create a cursor object
-        cursor = conn.cursor()
+        if mode not in VALIDATION_MODES:
+            # Never run a query whose mode is misspelled; it may only have been meant for validation
+            rows = json.dumps({'valid': False, 'error': f"Invalid mode {mode!r}. Choose either 'dry_run' or 'execute'."})
+        elif mode == 'dry_run':
+            # Compile and plan the query without running it
+            rows = validate_sql(conn, query)
+        else:
+            # Create a cursor object
+            cursor = conn.cursor()
 
-        # Execute the query
-        try:
-            cursor.execute(query)
-            # Fetch all results
-            rows = cursor.fetchall()
-        except sqlite3.OperationalError as e:
-        # Handle operational errors (e.g., syntax errors, missing tables)
-            rows = str(e)
-        except sqlite3.IntegrityError as e:
-        # Handle integrity errors (e.g., constraint violations)
-            rows = str(e)
-        except Exception as e:
-        # Handle any other exceptions
-            rows = str(e)
-
-        # Close the connection
-        conn.close()
+            # Execute the query
+            try:
+                cursor.execute(query)
+                # Fetch all results
+                rows = cursor.fetchall()
+            except sqlite3.OperationalError as e:
+            # Handle operational errors (e.g., syntax errors, missing tables)
+                rows = str(e)
+            except sqlite3.IntegrityError as e:
+            # Handle integrity errors (e.g., constraint violations)
+                rows = str(e)
+            except Exception as e:
+            # Handle any other exceptions
+                rows = str(e)
+            finally:
+                cursor.close()
     
         body_text=str(rows) 
     else:
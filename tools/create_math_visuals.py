@@ -1,13 +1,21 @@
-import matplotlib.pyplot as plt
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import matplotlib.image as mpimg
 import random
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError, NoCredentialsError
 import matplotlib.patches as patches
 import numpy as np
 import os
 
+import argparse
+import hashlib
 import json
 import shutil
+import tempfile
 from datetime import datetime
 import csv
 import io
@@ -17,7 +25,33 @@ original_file = 'tools/claude_3.5_sonnet_artifacts.txt'
 target_file = '/tmp/claude_3.5_sonnet_artifacts.txt'
 if not os.path.exists(target_file):
     shutil.copy2(original_file, target_file)
-    
+
+MATH_OPERATION_BUCKET = os.environ.get('MATH_OPERATION_BUCKET', 'mathoperation')
+MATH_FRACTION_BUCKET = os.environ.get('MATH_FRACTION_BUCKET', 'mathfraction')
+SVG_BUCKET = os.environ.get('SVG_BUCKET', 'sagemaker-us-east-1-827930657850')
+# Store the visuals under this directory (one sub-directory per bucket) instead of S3,
+# for tests and offline runs
+VISUALS_LOCAL_DIR = os.environ.get('VISUALS_LOCAL_DIR')
+# Bodies at least this large are uploaded in parts (the images are a few dozen KiB)
+S3_MULTIPART_THRESHOLD = int(os.environ.get('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+MATH_QUESTION_STYLE = os.environ.get('MATH_QUESTION_STYLE', 'banana')
+# Written by prerender_math_questions() and packaged with the Lambda
+MATH_QUESTION_INDEX = os.environ.get('MATH_QUESTION_INDEX', 'tools/math_question_index.json')
+# Part of every image key: bump it when the drawing changes so old images are not served
+MATH_QUESTION_RENDER_VERSION = 1
+SPRITE_IMAGES = {'banana': 'tools/banana.png'}
+# 'tile' draws the copies of a sprite as one tiled image, 'each' draws one image per copy
+SPRITE_COMPOSITE = os.environ.get('SPRITE_COMPOSITE', 'tile')
+# Keep one figure per container and redraw it, instead of building a figure per render
+REUSE_FIGURES = os.environ.get('REUSE_FIGURES', 'true').lower() == 'true'
+FRACTION_FIGSIZE = (4, 4)
+
+_s3_client = None
+_renderer = None
+_storages = {}
+_sprites = {}
+_math_question_keys = None
+
 
 def draw_fraction_rectangle(ax, total_parts, shaded_parts, position, color='pink'):
     """Draw a fraction representation using a rectangle divided into parts."""
@@ -37,20 +71,200 @@ def draw_fraction_circle(ax, total_parts, shaded_parts, position, color='gold'):
                               facecolor=color if is_shaded else 'white', edgecolor='black')
         ax.add_patch(wedge)
         
-def draw_image(ax, img_path, number, x_start, y_start, scale=1.0, x_offset=None):
-    """Draws images for representing numbers, with resizing and custom offsets."""
-    img = mpimg.imread(img_path)
-    img_height, img_width, _ = img.shape
+def load_sprite(img_path):
+    """Decoded sprite pixels, read from disk once per path and shared read-only."""
+    img = _sprites.get(img_path)
+    if img is None:
+        img = mpimg.imread(img_path)
+        img.setflags(write=False)
+        _sprites[img_path] = img
+    return img
+
+def tile_sprite(img, number, gap_pixels=0):
+    """One image of number copies of img side by side, separated by gap_pixels transparent columns."""
+    if gap_pixels:
+        gap = np.zeros((img.shape[0], gap_pixels, img.shape[2]), dtype=img.dtype)
+        img = np.concatenate([img, gap], axis=1)
+    tiled = np.tile(img, (1, number, 1))
+    return tiled[:, :tiled.shape[1] - gap_pixels] if gap_pixels else tiled
+
+def draw_image(ax, img_path, number, x_start, y_start, scale=1.0, x_offset=None, composite=None):
+    """
+    Draws images for representing numbers, with resizing and custom offsets.
+
+    With composite='tile' (the default, see SPRITE_COMPOSITE) the copies are tiled
+    into one array and drawn with a single imshow; overlapping copies (x_offset
+    smaller than the image width) and sprites without an alpha channel for the gaps
+    are drawn one by one as with composite='each'.
+    """
+    img = load_sprite(img_path)
+    img_height, img_width, channels = img.shape
     
     # Determine scale based on desired height in plot coordinates (e.g., 1 unit high)
     scaled_width = (img_width / img_height) * scale
     if x_offset is None:
         x_offset = scaled_width  # Ensure default offset is the width of the scaled image
-    
-    for i in range(number):
-        ax.imshow(img, aspect='auto', extent=(x_start + i * x_offset, x_start + i * x_offset + scaled_width, y_start, y_start + scale))
+    if number <= 0:
+        return x_start
+
+    gap_pixels = round((x_offset - scaled_width) / scaled_width * img_width)
+    if (composite or SPRITE_COMPOSITE) == 'tile' and gap_pixels >= 0 and (gap_pixels == 0 or channels == 4):
+        end = x_start + (number - 1) * x_offset + scaled_width
+        ax.imshow(tile_sprite(img, number, gap_pixels), aspect='auto', extent=(x_start, end, y_start, y_start + scale))
+    else:
+        for i in range(number):
+            ax.imshow(img, aspect='auto', extent=(x_start + i * x_offset, x_start + i * x_offset + scaled_width, y_start, y_start + scale))
     return x_start + number * x_offset  # Return the end position after the last image
 
+class FigureRenderer:
+    """
+    Renders the visuals on Agg figures built with the object-oriented API.
+
+    The figures are never registered with pyplot, so nothing keeps them alive once
+    a render is done, and no pyplot state is touched per call. With reuse=True one
+    figure is kept, resized and cleared for every render so warm invocations do
+    not build a new figure; its artists are dropped as soon as the image is saved.
+    """
+
+    def __init__(self, reuse=True, dpi=None):
+        self.reuse = reuse
+        self.dpi = dpi
+        self._figure = None
+
+    def figure(self, figsize):
+        """An empty figure of figsize inches with an Agg canvas."""
+        fig = self._figure
+        if fig is None:
+            fig = Figure(figsize=figsize, dpi=self.dpi)
+            FigureCanvasAgg(fig)
+            if self.reuse:
+                self._figure = fig
+        else:
+            fig.set_size_inches(figsize)
+        return fig
+
+    def release(self, fig):
+        """Drop the figure's artists (and the images they reference) after a render."""
+        fig.clear()
+
+    def render_png(self, figsize, draw, *args, **kwargs):
+        """Call draw(fig, *args, **kwargs) on a figure of figsize inches and return it encoded as PNG."""
+        fig = self.figure(figsize)
+        buffer = io.BytesIO()
+        try:
+            draw(fig, *args, **kwargs)
+            fig.savefig(buffer, format='png')
+        finally:
+            self.release(fig)
+        return buffer.getvalue()
+
+def get_renderer():
+    """One figure renderer per container, created on first use."""
+    global _renderer
+    if _renderer is None:
+        _renderer = FigureRenderer(reuse=REUSE_FIGURES)
+    return _renderer
+
+class S3Storage:
+    """
+    Stores visuals in an S3 bucket straight from memory: put_object for small
+    bodies, a multipart upload from the buffer for bodies of multipart_threshold
+    bytes or more. No temporary file is written.
+    """
+
+    def __init__(self, bucket, client=None, multipart_threshold=S3_MULTIPART_THRESHOLD):
+        self.bucket = bucket
+        self.location = bucket
+        self._client = client
+        self.multipart_threshold = multipart_threshold
+
+    @property
+    def client(self):
+        return self._client or get_s3_client()
+
+    def exists(self, key):
+        """
+        True if the bucket has key (an S3 HEAD request). A failed check (403 when the
+        role lacks s3:ListBucket, missing credentials) is logged and counts as a miss,
+        so the caller renders and puts the image instead of failing.
+        """
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+                print(f"Could not check s3://{self.bucket}/{key}: {e}")
+            return False
+        except NoCredentialsError:
+            print("Credentials not available.")
+            return False
+        return True
+
+    def put(self, key, body, content_type):
+        if len(body) < self.multipart_threshold:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+        else:
+            config = TransferConfig(multipart_threshold=self.multipart_threshold)
+            self.client.upload_fileobj(io.BytesIO(body), self.bucket, key,
+                                       ExtraArgs={'ContentType': content_type}, Config=config)
+
+    def link(self, key):
+        return f"s3://{self.bucket}/{key}"
+
+    def url(self, key, expiration=3600):
+        """Pre-signed GET URL of key, or None without credentials."""
+        try:
+            return self.client.generate_presigned_url('get_object', Params={'Bucket': self.bucket, 'Key': key},
+                                                      ExpiresIn=expiration)
+        except NoCredentialsError:
+            print("Credentials not available.")
+            return None
+
+class LocalStorage:
+    """
+    Stores visuals as files under root, with the same interface as S3Storage. Files
+    are written to a unique temporary name and renamed into place, so concurrent
+    writers of one key never see a partial file.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.location = self.root
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, body, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(body)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def link(self, key):
+        return 'file://' + self._path(key)
+
+    def url(self, key, expiration=3600):
+        return self.link(key)
+
+def get_storage(bucket):
+    """Storage of a bucket: S3, or a directory per bucket under VISUALS_LOCAL_DIR when it is set."""
+    storage = _storages.get(bucket)
+    if storage is None:
+        if VISUALS_LOCAL_DIR:
+            storage = LocalStorage(os.path.join(VISUALS_LOCAL_DIR, bucket))
+        else:
+            storage = S3Storage(bucket)
+        _storages[bucket] = storage
+    return storage
+
 def read_txt_to_string(file_path):
     with open(file_path, 'r') as file:
         txt_content = file.read()
@@ -65,15 +279,7 @@ def generate_presigned_url(bucket_name, s3_key, expiration=3600):
     :param expiration: Time in seconds for the pre-signed URL to remain valid (default: 3600)
     :return: Pre-signed URL as string. If error, returns None.
     """
-    s3_client = boto3.client('s3')
-    try:
-        response = s3_client.generate_presigned_url('get_object',
-                                                    Params={'Bucket': bucket_name, 'Key': s3_key},
-                                                    ExpiresIn=expiration)
-        return response
-    except NoCredentialsError:
-        print("Credentials not available.")
-        return None
+    return S3Storage(bucket_name).url(s3_key, expiration)
 def create_svg(task):
     # call llm to handle task, to add data reading and updated prompt template
     bedrock_client = boto3.client("bedrock-runtime")
@@ -112,41 +318,28 @@ Create a SVG for this task {task}. Below is how you create such an artifact.
     content_text = response_body['content'][0]['text']
     svg_content = re.search(r'<svg.*?>.*?</svg>', content_text, re.DOTALL).group(0)
 
-    # Save the SVG content to a file
-    file_path = f'/tmp/{task}.svg'
-    with open(file_path, 'w') as file:
-        file.write(svg_content)
-
-
-    # Upload the file to S3
-    s3 = boto3.client('s3')
-    s3_bucket_name = 'sagemaker-us-east-1-827930657850'
+    # Store the SVG straight from memory
+    storage = get_storage(SVG_BUCKET)
     s3_key = f'{task}.svg'
     try:
-        s3.upload_file(file_path, s3_bucket_name, s3_key)
-
+        storage.put(s3_key, svg_content.encode('utf-8'), 'image/svg+xml')
     except Exception as e:
-        print(f"Failed to upload file to S3: {e}")
-    finally:
-        # Clean up the local file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            
-    
-    # link = f"s3://{s3_bucket_name}/{s3_key}"
-    link = generate_presigned_url(s3_bucket_name, s3_key)
-    print(f'SVG file {file_path} has been uploaded to {link}.')
+        print(f"Failed to store {s3_key}: {e}")
+
+    link = storage.url(s3_key)
+    print(f'SVG for task {task} has been stored at {link}.')
     
     return link
 
-def create_math_question_with_images(operation='add'):
-    """
-    Create a math question using images. Supports addition and subtraction.
-    
-    Parameters:
-    - operation: Operation type, either 'add' for addition or 'subtract' for subtraction.
-    """
-    image_path='tools/banana.png'
+def get_s3_client():
+    """One S3 client per container, created on first use."""
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = boto3.client('s3')
+    return _s3_client
+
+def math_question_numbers(operation):
+    """Draw random operands for an addition (sum at most 10) or subtraction (positive result) question."""
     if operation == 'add':
         number_a = random.randint(1, 9)
         number_b = random.randint(1, 10 - number_a)
@@ -155,9 +348,58 @@ def create_math_question_with_images(operation='add'):
         number_b = random.randint(1, number_a - 1)  # Ensure number_b is less than number_a
     else:
         raise ValueError("Invalid operation. Choose either 'add' or 'subtract'.")
-
+    return number_a, number_b
+
+def math_question_space():
+    """Every (operation, number_a, number_b) that math_question_numbers() can draw."""
+    for number_a in range(1, 10):
+        for number_b in range(1, 11 - number_a):
+            yield 'add', number_a, number_b
+    for number_a in range(2, 11):
+        for number_b in range(1, number_a):
+            yield 'subtract', number_a, number_b
+
+def math_question_key(operation, number_a, number_b, style=MATH_QUESTION_STYLE):
+    """
+    Content-addressed S3 key of a question image: a digest of everything that
+    determines the rendered picture, so equal questions share one object.
+    """
+    content = json.dumps([MATH_QUESTION_RENDER_VERSION, operation, int(number_a), int(number_b), style])
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:16]
+    return f"{operation}/{number_a}_{operation}_{number_b}-{style}-{digest}.png"
+
+def load_math_question_keys(index_file=MATH_QUESTION_INDEX, bucket=MATH_OPERATION_BUCKET):
+    """Keys known to be in the bucket, starting from the packaged index; kept for the life of the container."""
+    global _math_question_keys
+    if _math_question_keys is None:
+        try:
+            with open(index_file) as file:
+                index = json.load(file)
+            location = get_storage(bucket).location
+            _math_question_keys = set(index['keys']) if index.get('bucket') == location else set()
+        except FileNotFoundError:
+            _math_question_keys = set()
+    return _math_question_keys
+
+def math_question_cached(key, bucket=MATH_OPERATION_BUCKET):
+    """True if the image is already in the bucket: checks the known keys, then the storage (an S3 HEAD request)."""
+    keys = load_math_question_keys(bucket=bucket)
+    if key in keys:
+        return True
+    if not get_storage(bucket).exists(key):
+        return False
+    keys.add(key)
+    return True
+
+def math_question_figsize(number_a, number_b):
+    """Figure size in inches of a question: the width grows with the number of images."""
+    return ((number_a + number_b) * 1.5, 3)
+
+def draw_math_question(fig, operation, number_a, number_b, style=MATH_QUESTION_STYLE):
+    """Draw a question on fig as number_a sprites, the operation, number_b sprites and '= ?'."""
+    image_path = SPRITE_IMAGES[style]
     total_images = number_a + number_b
-    fig, ax = plt.subplots(figsize=(total_images * 1.5, 3))  # Adjust width based on total images
+    ax = fig.add_subplot()
     ax.set_xlim(0, total_images * 1.5)  # Extend the x-axis limits
     ax.set_ylim(0, 2)
     ax.axis('off')  # Turn off the axis
@@ -178,38 +420,68 @@ def create_math_question_with_images(operation='add'):
     # Draw the question mark
     ax.text(next_x + 1.5, 1.5, '?', fontsize=15, ha='center')
 
-    # Save the plot to a temporary file
-    file_path = f'/tmp/{number_a}_{operation}_{number_b}.png'
-    plt.savefig(file_path)
+def render_math_question(operation, number_a, number_b, s3_key, style=MATH_QUESTION_STYLE, bucket=MATH_OPERATION_BUCKET):
+    """
+    Render a question image and store it at s3_key in the bucket's storage.
 
-    # Upload the file to S3
-    s3 = boto3.client('s3')
-    s3_bucket_name = 'mathoperation'
-    s3_key = f"{number_a}_{operation}_{number_b}.png"
+    :return: True if the image was stored
+    """
+    body = get_renderer().render_png(math_question_figsize(number_a, number_b), draw_math_question,
+                                     operation, number_a, number_b, style)
     try:
-        s3.upload_file(file_path, s3_bucket_name, s3_key)
-
+        get_storage(bucket).put(s3_key, body, 'image/png')
+        return True
     except Exception as e:
-        print(f"Failed to upload file to S3: {e}")
-    finally:
-        # Clean up the local file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    link = f"s3://{s3_bucket_name}/{s3_key}"
-    return link, number_a, number_b, operation
+        print(f"Failed to store {s3_key}: {e}")
+        return False
 
-def create_fraction_illustration(numerator, denominator, shape ='rectangle'):
+def create_math_question_with_images(operation='add', style=MATH_QUESTION_STYLE):
     """
-    Create a fraction illustration using rectangles or circles.
-    
+    Create a math question using images. Supports addition and subtraction.
+
+    The image is looked up by its content-addressed key first and only rendered
+    and uploaded when the bucket does not have it yet (see prerender_math_questions()).
+
     Parameters:
-    - numerator: Number of shaded parts (top number of the fraction).
-    - denominator: Total number of parts (bottom number of the fraction).
-    - shape: Type of shape to use ('rectangle' or 'circle').
+    - operation: Operation type, either 'add' for addition or 'subtract' for subtraction.
+    - style: Sprite used to draw the numbers, a key of SPRITE_IMAGES.
     """
-    numerator = int(numerator)
-    denominator = int(denominator)
-    fig, ax = plt.subplots(figsize=(4, 4))
+    number_a, number_b = math_question_numbers(operation)
+    s3_key = math_question_key(operation, number_a, number_b, style)
+    if not math_question_cached(s3_key):
+        if render_math_question(operation, number_a, number_b, s3_key, style):
+            load_math_question_keys().add(s3_key)
+    link = get_storage(MATH_OPERATION_BUCKET).link(s3_key)
+    return link, number_a, number_b, operation
+
+def prerender_math_questions(style=MATH_QUESTION_STYLE, index_file=MATH_QUESTION_INDEX,
+                             bucket=MATH_OPERATION_BUCKET, force=False):
+    """
+    Materialize every question of math_question_space() in the bucket and write the
+    index packaged with the Lambda, so create_math_question_with_images() only looks
+    up a key. Images already in the bucket are skipped unless force is set.
+
+    :return: (number of images rendered, number of questions)
+    """
+    keys, rendered = [], 0
+    for operation, number_a, number_b in math_question_space():
+        s3_key = math_question_key(operation, number_a, number_b, style)
+        if force or not math_question_cached(s3_key, bucket):
+            if not render_math_question(operation, number_a, number_b, s3_key, style, bucket):
+                raise Exception(f"Failed to pre-render {s3_key}")
+            rendered += 1
+        keys.append(s3_key)
+    with open(index_file, 'w') as file:
+        json.dump({'bucket': get_storage(bucket).location, 'style': style,
+                   'render_version': MATH_QUESTION_RENDER_VERSION,
+                   'created_at': datetime.now().isoformat(timespec='seconds'), 'keys': keys}, file, indent=1)
+    print(f"{rendered} of {len(keys)} question images rendered into {get_storage(bucket).link('')}, "
+          f"index written to {index_file}")
+    return rendered, len(keys)
+
+def draw_fraction_illustration(fig, numerator, denominator, shape='rectangle'):
+    """Draw numerator of denominator parts shaded on fig, as a row of rectangles or a circle."""
+    ax = fig.add_subplot()
     ax.set_xlim(-1, denominator + 1)
     ax.set_ylim(-1, 2)
     ax.axis('off')
@@ -222,26 +494,28 @@ def create_fraction_illustration(numerator, denominator, shape ='rectangle'):
         draw_fraction_circle(ax, denominator, numerator, position)
     else:
         raise ValueError("Invalid shape. Choose either 'rectangle' or 'circle'.")
- 
-    # Save the plot to a temporary file
-    file_path = f'/tmp/{numerator}_{denominator}_{shape}.png'
-    plt.savefig(file_path)
 
+def create_fraction_illustration(numerator, denominator, shape ='rectangle'):
+    """
+    Create a fraction illustration using rectangles or circles.
+    
+    Parameters:
+    - numerator: Number of shaded parts (top number of the fraction).
+    - denominator: Total number of parts (bottom number of the fraction).
+    - shape: Type of shape to use ('rectangle' or 'circle').
+    """
+    numerator = int(numerator)
+    denominator = int(denominator)
+    body = get_renderer().render_png(FRACTION_FIGSIZE, draw_fraction_illustration, numerator, denominator, shape)
 
-    # Upload the file to S3
-    s3 = boto3.client('s3')
-    s3_bucket_name = 'mathfraction'
+    # Store the image straight from memory
+    storage = get_storage(MATH_FRACTION_BUCKET)
     s3_key = f"{numerator}_{denominator}_{shape}.png"
     try:
-        s3.upload_file(file_path, s3_bucket_name, s3_key)
-
+        storage.put(s3_key, body, 'image/png')
     except Exception as e:
-        print(f"Failed to upload file to S3: {e}")
-    finally:
-        # Clean up the local file
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    link = f"s3://{s3_bucket_name}/{s3_key}"
+        print(f"Failed to store {s3_key}: {e}")
+    link = storage.link(s3_key)
     return link, numerator, denominator, shape
     
 def lambda_handler(event, context):
@@ -259,7 +533,7 @@ def lambda_handler(event, context):
 
     
     if function == 'create_math_question_with_images':
-        course_code = None
+        operation = None
         for param in parameters:
             if param["name"] == "operation":
                 operation = param["value"]
@@ -325,3 +599,16 @@ def lambda_handler(event, context):
     print("Response: {}".format(function_response))
 
     return function_response
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render the images of create_math_question_with_images. '
+                                                 'Set VISUALS_LOCAL_DIR to render into a local directory instead of S3.')
+    parser.add_argument('--prerender', action='store_true', help='render every question missing from the bucket')
+    parser.add_argument('--style', default=MATH_QUESTION_STYLE, choices=sorted(SPRITE_IMAGES))
+    parser.add_argument('--force', action='store_true', help='re-render images already in the bucket')
+    args = parser.parse_args()
+    if args.prerender:
+        prerender_math_questions(args.style, force=args.force)
+    else:
+        parser.print_help()
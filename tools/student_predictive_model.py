@@ -1,22 +1,542 @@
-import os
+import hashlib
 import json
-import shutil
+import mmap
+import os
 import sqlite3
-import boto3
-from datetime import datetime
-import csv
-import io
+import struct
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+_module_loaded_at = time.perf_counter()
+
+ACADEMIC_DB_FILE = os.environ.get('ACADEMIC_DB_FILE', 'porterville_academic.db')
+STUDENT_ID_WIDTH = int(os.environ.get('STUDENT_ID_WIDTH', 3))
+
+# Grade points for GPA; W counts as an attempt that did not succeed but has no grade points.
+GRADE_POINTS = {'A': 4.0, 'A-': 3.7, 'B+': 3.3, 'B': 3.0, 'B-': 2.7, 'C+': 2.3, 'C': 2.0, 'D': 1.0, 'F': 0.0}
+PASSING_GRADES = {'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D'}
+
+# Averages over few courses are shrunk toward their parent average with this weight (in courses)
+PRIOR_WEIGHT = float(os.environ.get('PREDICTION_PRIOR_WEIGHT', 5))
+L2_PENALTY = float(os.environ.get('PREDICTION_L2_PENALTY', 1.0))
+NEWTON_ITERATIONS = 8
+PREDICTION_TOP_K = int(os.environ.get('PREDICTION_TOP_K', 10))
+
+# Model artifact written by build_feature_store(), memory-mapped on the first prediction.
+# MODEL_ARTIFACT_VERIFY: 'none', 'weights' (checksums of the weights and priors) or 'full'.
+MODEL_ARTIFACT_FILE = os.environ.get('MODEL_ARTIFACT_FILE', 'student_success_model.bin')
+MODEL_ARTIFACT_VERIFY = os.environ.get('MODEL_ARTIFACT_VERIFY', 'weights')
+
+# Artifact layout: magic, format version and header length, a JSON header describing
+# every array (dtype, shape, offset, size, sha256), then the raw little-endian arrays,
+# each starting on an ARTIFACT_ALIGNMENT boundary so they can be viewed in place.
+ARTIFACT_MAGIC = b'SSMODEL\x00'
+ARTIFACT_FORMAT_VERSION = 1
+ARTIFACT_ALIGNMENT = 64
+_ARTIFACT_PREAMBLE = struct.Struct('<8sII')
+
+STAT_COLUMNS = ['points', 'graded', 'passed', 'attempts']
+STORE_ARRAYS = [
+    'student_ids', 'course_codes', 'subjects', 'student_stats', 'course_stats', 'subject_stats',
+    'course_subjects', 'course_levels', 'priors', 'weights',
+]
+FEATURE_NAMES = [
+    'bias', 'student_gpa', 'student_pass_rate', 'course_pass_logit',
+    'course_mean_points', 'student_subject_gpa', 'course_level',
+]
+
+
+def open_database(db_file=ACADEMIC_DB_FILE):
+    """Open the packaged academic database read-only; immutable skips locking and change detection."""
+    return sqlite3.connect(f'file:{os.path.abspath(db_file)}?mode=ro&immutable=1', uri=True)
+
+
+def normalize_student_id(student_id):
+    student_id = str(student_id).strip()
+    return student_id.zfill(STUDENT_ID_WIDTH) if student_id.isdigit() else student_id
+
+
+def subject_of(course_code):
+    return course_code.split(' ')[0]
+
+
+def course_level(course_code):
+    """Course number in hundreds, e.g. 1.1 for 'BIOL P110'; 0 when the code has no number."""
+    digits = ''.join(ch for ch in course_code.split(' ')[-1] if ch.isdigit())
+    return int(digits[:3]) / 100 if digits else 0.0
+
+
+def _smooth(total, count, prior, weight=PRIOR_WEIGHT):
+    return (total + weight * prior) / (count + weight)
+
+
+def _logit(p):
+    p = np.clip(p, 1e-3, 1 - 1e-3)
+    return np.log(p / (1 - p))
+
+
+def _sigmoid(z):
+    return 1 / (1 + np.exp(-z))
+
+
+def grade_values(grades):
+    """Per-row (points, graded, passed, attempts) contributions of a sequence of grades."""
+    return np.array([
+        (GRADE_POINTS.get(grade, 0.0), grade in GRADE_POINTS, grade in PASSING_GRADES, 1.0) for grade in grades
+    ], dtype=np.float64).reshape(-1, len(STAT_COLUMNS))
+
+
+def accumulate(index, values, size):
+    """Sum the rows of values into size buckets given by index."""
+    return np.column_stack([np.bincount(index, values[:, k], size) for k in range(values.shape[1])])
+
+
+def lookup(sorted_keys, keys):
+    """Positions of keys in a sorted key array, -1 where a key is missing."""
+    keys = np.asarray(keys, dtype=str)
+    if sorted_keys.dtype.kind == 'S':
+        # Id arrays memory-mapped from an artifact hold UTF-8 bytes
+        keys = np.char.encode(keys, 'utf-8')
+    if not len(sorted_keys):
+        return np.full(len(keys), -1, dtype=np.intp)
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+    return np.where(sorted_keys[positions] == keys, positions, -1)
+
+
+def feature_matrix(student, course, subject, levels, priors):
+    """
+    Turn raw statistics into the FEATURE_NAMES matrix. student and course are
+    (m, 4) STAT_COLUMNS rows, subject is (m, 2) points/graded rows of the student in
+    the course's subject. All-zero rows (unknown students, courses or subjects)
+    fall back to the priors, so training and prediction share one definition.
+    """
+    mean_points, pass_rate = float(priors[0]), float(priors[1])
+    X = np.empty((len(student), len(FEATURE_NAMES)), dtype=np.float32)
+    X[:, 0] = 1.0
+    X[:, 1] = student_gpa = _smooth(student[:, 0], student[:, 1], mean_points)
+    X[:, 2] = _smooth(student[:, 2], student[:, 3], pass_rate)
+    X[:, 3] = _logit(_smooth(course[:, 2], course[:, 3], pass_rate))
+    X[:, 4] = _smooth(course[:, 0], course[:, 1], mean_points)
+    X[:, 5] = _smooth(subject[:, 0], subject[:, 1], student_gpa)
+    X[:, 6] = levels
+    return X
+
+
+def priors_from(student_stats):
+    points, graded, passed, attempts = student_stats.sum(axis=0)
+    return np.array([points / max(graded, 1.0), passed / max(attempts, 1.0)])
+
+
+class StudentSuccessModel:
+    """
+    Logistic model of the probability that a student passes a course.
+
+    The model keeps raw grade statistics (STAT_COLUMNS sums) per student, per course
+    and per student and subject, indexed by sorted id arrays. Scoring gathers the
+    rows of one student and the candidate courses, turns them into FEATURE_NAMES
+    with feature_matrix() and takes one dot product with the weights. Because only
+    sums are kept, the statistics of a student or course can be recomputed in
+    place when new grades arrive, and every array can be memory-mapped from a
+    single model artifact (see save() and load()).
+    """
+
+    def __init__(self, student_ids, course_codes, subjects, student_stats, course_stats, subject_stats,
+                 course_subjects, course_levels, priors, weights):
+        self.student_ids = student_ids          # (students,) sorted
+        self.course_codes = course_codes        # (courses,) sorted
+        self.subjects = subjects                # (subjects,) sorted
+        self.student_stats = student_stats      # (students, 4)
+        self.course_stats = course_stats        # (courses, 4)
+        self.subject_stats = subject_stats      # (students, subjects, 2): points, graded
+        self.course_subjects = course_subjects  # (courses,) subject index
+        self.course_levels = course_levels      # (courses,)
+        self.priors = priors                    # (2,): mean grade points, pass rate
+        self.weights = weights                  # (features,)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Compute the statistics from (student_id, course_code, grade) rows and fit the weights."""
+        if not rows:
+            raise ValueError('student_data has no graded rows to build the model from')
+        student_ids, course_codes, grades = (np.array(column) for column in zip(*rows))
+        students, s = np.unique(student_ids, return_inverse=True)
+        courses, c = np.unique(course_codes, return_inverse=True)
+        subjects, course_subjects = np.unique([subject_of(code) for code in courses], return_inverse=True)
+        course_levels = np.array([course_level(code) for code in courses], dtype=np.float32)
+        values = grade_values(grades)
+
+        n_s, n_c, n_subj = len(students), len(courses), len(subjects)
+        j = course_subjects[c]
+        student_stats = accumulate(s, values, n_s)
+        course_stats = accumulate(c, values, n_c)
+        subject_stats = accumulate(s * n_subj + j, values[:, :2], n_s * n_subj).reshape(n_s, n_subj, 2)
+        priors = priors_from(student_stats)
+
+        # Leave-one-out features: each row's own grade is removed from the statistics
+        X = feature_matrix(student_stats[s] - values, course_stats[c] - values,
+                           subject_stats[s, j] - values[:, :2], course_levels[c], priors)
+        # The bias starts from, and is regularized toward, the pass rate smoothed toward even odds
+        bias_prior = float(_logit(_smooth(values[:, 2].sum(), len(values), 0.5)))
+        weights = fit_logistic(X.astype(np.float64), values[:, 2], bias_prior=bias_prior)
+        return cls(students, courses, subjects, student_stats.astype(np.float32), course_stats.astype(np.float32),
+                   subject_stats.astype(np.float32), course_subjects.astype(np.int32), course_levels,
+                   priors, weights.astype(np.float32))
+
+    @classmethod
+    def from_database(cls, conn):
+        return cls.from_rows(conn.execute(
+            'SELECT student_id, course_code, grade FROM student_data WHERE grade IS NOT NULL'
+        ).fetchall())
+
+    def features(self, student_id, course_codes):
+        """Feature matrix (len(course_codes), len(FEATURE_NAMES)) for one student; unknown ids fall back to priors."""
+        m = len(course_codes)
+        s = lookup(self.student_ids, [normalize_student_id(student_id)])[0]
+        c = lookup(self.course_codes, course_codes)
+        known = c >= 0
+        if known.all():
+            course, levels, j = self.course_stats[c], self.course_levels[c], self.course_subjects[c]
+        else:
+            course = np.zeros((m, len(STAT_COLUMNS)), dtype=np.float32)
+            course[known] = self.course_stats[c[known]]
+            unknown = [code for code, is_known in zip(course_codes, known) if not is_known]
+            levels = np.empty(m, dtype=np.float32)
+            levels[known] = self.course_levels[c[known]]
+            levels[~known] = [course_level(code) for code in unknown]
+            j = np.empty(m, dtype=np.intp)
+            j[known] = self.course_subjects[c[known]]
+            j[~known] = lookup(self.subjects, [subject_of(code) for code in unknown])
+        if s < 0:
+            student = np.zeros((m, len(STAT_COLUMNS)), dtype=np.float32)
+            subject = np.zeros((m, 2), dtype=np.float32)
+        else:
+            student = np.broadcast_to(self.student_stats[s], (m, len(STAT_COLUMNS)))
+            subject = self.subject_stats[s, j]
+            if (j < 0).any():
+                subject[j < 0] = 0.0
+        return feature_matrix(student, course, subject, levels, self.priors)
+
+    def predict(self, student_id, course_codes):
+        """Probability of passing each course, as a float32 array."""
+        return _sigmoid(self.features(student_id, course_codes) @ self.weights)
+
+    def updated(self, conn, term):
+        """
+        Return a model whose statistics are recomputed for every student and course
+        with grades in term; new students, courses and subjects are added to the
+        index. The weights are kept (rebuild the store to refit them).
+        """
+        term = int(term)
+        current = {name: np.char.decode(array, 'utf-8') if array.dtype.kind == 'S' else array
+                   for name, array in (('student_ids', self.student_ids), ('course_codes', self.course_codes),
+                                       ('subjects', self.subjects))}
+        term_students = [row[0] for row in conn.execute(
+            'SELECT DISTINCT student_id FROM student_data WHERE term = ?', (term,))]
+        term_courses = [row[0] for row in conn.execute(
+            'SELECT DISTINCT course_code FROM student_data WHERE term = ?', (term,))]
+        student_rows = conn.execute(
+            'SELECT student_id, course_code, grade FROM student_data WHERE grade IS NOT NULL '
+            'AND student_id IN (SELECT value FROM json_each(?))', (json.dumps(term_students),)).fetchall()
+        course_rows = conn.execute(
+            'SELECT course_code, grade FROM student_data WHERE grade IS NOT NULL '
+            'AND course_code IN (SELECT value FROM json_each(?))', (json.dumps(term_courses),)).fetchall()
+        students = np.union1d(current['student_ids'], np.array(term_students, dtype=str))
+        courses = np.union1d(current['course_codes'], np.array(term_courses + [row[1] for row in student_rows], dtype=str))
+        subjects = np.union1d(current['subjects'], np.array([subject_of(code) for code in courses], dtype=str))
+        n_s, n_subj = len(students), len(subjects)
+
+        # Carry the existing statistics over to the new index
+        old_s = lookup(students, current['student_ids'])
+        old_c = lookup(courses, current['course_codes'])
+        old_j = lookup(subjects, current['subjects'])
+        student_stats = np.zeros((n_s, len(STAT_COLUMNS)))
+        student_stats[old_s] = self.student_stats
+        course_stats = np.zeros((len(courses), len(STAT_COLUMNS)))
+        course_stats[old_c] = self.course_stats
+        subject_stats = np.zeros((n_s, n_subj, 2))
+        subject_stats[np.ix_(old_s, old_j)] = self.subject_stats
+        course_subjects = lookup(subjects, [subject_of(code) for code in courses])
+        course_levels = np.array([course_level(code) for code in courses], dtype=np.float32)
+
+        # Recompute the touched students from their full history
+        if student_rows:
+            student_ids, course_codes, grades = zip(*student_rows)
+            s, c, values = lookup(students, student_ids), lookup(courses, course_codes), grade_values(grades)
+            touched = lookup(students, term_students)
+            student_stats[touched] = 0.0
+            subject_stats[touched] = 0.0
+            student_stats += accumulate(s, values, n_s)
+            subject_stats += accumulate(s * n_subj + course_subjects[c], values[:, :2], n_s * n_subj).reshape(n_s, n_subj, 2)
+
+        # ... and the touched courses from all of their grades
+        if course_rows:
+            course_codes, grades = zip(*course_rows)
+            course_stats[lookup(courses, term_courses)] = 0.0
+            course_stats += accumulate(lookup(courses, course_codes), grade_values(grades), len(courses))
+
+        return StudentSuccessModel(
+            students, courses, subjects, student_stats.astype(np.float32), course_stats.astype(np.float32),
+            subject_stats.astype(np.float32), course_subjects.astype(np.int32), course_levels,
+            priors_from(student_stats), self.weights)
+
+    def save(self, path, metadata=None):
+        """Write the model as a versioned artifact; ids are stored as UTF-8 bytes, statistics as float32."""
+        arrays = {}
+        for name in STORE_ARRAYS:
+            array = getattr(self, name)
+            if array.dtype.kind == 'U':
+                array = np.char.encode(array, 'utf-8')
+            elif array.dtype.kind == 'f':
+                array = array.astype('<f4')
+            elif array.dtype.kind == 'i':
+                array = array.astype('<i4')
+            arrays[name] = array
+        write_artifact(path, arrays, {
+            'feature_names': FEATURE_NAMES, 'stat_columns': STAT_COLUMNS,
+            'students': len(self.student_ids), 'courses': len(self.course_codes), **(metadata or {}),
+        })
+
+    @classmethod
+    def load(cls, path, verify=MODEL_ARTIFACT_VERIFY):
+        """Memory-map an artifact written by save(); pages are only read when a prediction touches them."""
+        header, arrays = read_artifact(path, verify)
+        if header['metadata'].get('feature_names') != FEATURE_NAMES:
+            raise ValueError(f"{path} was built for features {header['metadata'].get('feature_names')}")
+        missing = [name for name in STORE_ARRAYS if name not in arrays]
+        if missing:
+            raise ValueError(f"{path} is missing arrays {missing}")
+        return cls(**{name: arrays[name] for name in STORE_ARRAYS})
+
+
+def _aligned(size):
+    return -(-size // ARTIFACT_ALIGNMENT) * ARTIFACT_ALIGNMENT
+
+
+def write_artifact(path, arrays, metadata):
+    """
+    Write arrays and metadata in the artifact layout. The file is written next to
+    path and renamed over it, so readers never see a partial artifact.
+    """
+    entries, blobs, offset = {}, [], 0
+    for name, array in arrays.items():
+        data = np.ascontiguousarray(array).tobytes()
+        entries[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset,
+                         'nbytes': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+        blobs.append(data)
+        offset += _aligned(len(data))
+    header = json.dumps({
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'arrays': entries,
+        'metadata': metadata,
+    }).encode('utf-8')
+    data_start = _aligned(_ARTIFACT_PREAMBLE.size + len(header))
+    staging = path + '.tmp'
+    with open(staging, 'wb') as file:
+        file.write(_ARTIFACT_PREAMBLE.pack(ARTIFACT_MAGIC, ARTIFACT_FORMAT_VERSION, len(header)))
+        file.write(header)
+        file.write(b'\0' * (data_start - _ARTIFACT_PREAMBLE.size - len(header)))
+        for data in blobs:
+            file.write(data)
+            file.write(b'\0' * (_aligned(len(data)) - len(data)))
+    os.replace(staging, path)
+
+
+def read_artifact(path, verify=MODEL_ARTIFACT_VERIFY):
+    """
+    Memory-map an artifact and return (header, {name: read-only array view}).
+
+    The layout is always checked (magic, format version, bounds and sizes of every
+    array); checksums are checked for the weights and priors with verify='weights',
+    for every array with verify='full', and skipped with verify='none'.
+
+    :raises ValueError: if the file is not a valid artifact of a supported version
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) < _ARTIFACT_PREAMBLE.size:
+        raise ValueError(f'{path} is too short to be a model artifact')
+    magic, version, header_size = _ARTIFACT_PREAMBLE.unpack_from(buffer)
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError(f'{path} is not a model artifact')
+    if version != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f'{path} has unsupported artifact format version {version}')
+    header = json.loads(buffer[_ARTIFACT_PREAMBLE.size:_ARTIFACT_PREAMBLE.size + header_size])
+    data_start = _aligned(_ARTIFACT_PREAMBLE.size + header_size)
+
+    arrays = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        start = data_start + entry['offset']
+        count = int(np.prod(entry['shape']))
+        if entry['nbytes'] != count * dtype.itemsize or start + entry['nbytes'] > len(buffer):
+            raise ValueError(f'{path}: array {name} is truncated or malformed')
+        if verify == 'full' or (verify == 'weights' and name in ('weights', 'priors')):
+            if hashlib.sha256(buffer[start:start + entry['nbytes']]).hexdigest() != entry['sha256']:
+                raise ValueError(f'{path}: checksum mismatch for array {name}')
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=start).reshape(entry['shape'])
+    return header, arrays
+
+
+def fit_logistic(X, y, l2=L2_PENALTY, iterations=NEWTON_ITERATIONS, bias_prior=0.0):
+    """
+    L2-regularized logistic regression by Newton's method. The bias is pulled toward
+    bias_prior instead of zero, so it stays finite when the labels are one class;
+    with one class there is nothing to separate and the prior weights are returned.
+    """
+    center = np.zeros(X.shape[1])
+    center[0] = bias_prior
+    weights = center.copy()
+    if y.min() == y.max():
+        return weights
+    penalty = np.full(X.shape[1], l2)
+    for _ in range(iterations):
+        p = _sigmoid(X @ weights)
+        gradient = X.T @ (p - y) + penalty * (weights - center)
+        hessian = (X.T * (p * (1 - p))) @ X + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+        weights -= step
+        if np.abs(step).max() < 1e-6:
+            break
+    return weights
+
+
+def _data_version(conn):
+    try:
+        return conn.execute('SELECT version FROM academic_data_version').fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def build_feature_store(db_file=ACADEMIC_DB_FILE, artifact_file=MODEL_ARTIFACT_FILE):
+    """Compute the model from student_data, fit its weights and write it to artifact_file."""
+    conn = open_database(db_file)
+    try:
+        model = StudentSuccessModel.from_database(conn)
+        model.save(artifact_file, {'data_version': _data_version(conn)})
+    finally:
+        conn.close()
+    return model
+
+
+def update_feature_store(term, db_file=ACADEMIC_DB_FILE, artifact_file=MODEL_ARTIFACT_FILE):
+    """Refresh the model artifact after utils.academic_db.ingest_term() loaded term into student_data."""
+    conn = open_database(db_file)
+    try:
+        model = StudentSuccessModel.load(artifact_file, verify='full').updated(conn, term)
+        model.save(artifact_file, {'data_version': _data_version(conn), 'updated_term': int(term)})
+    finally:
+        conn.close()
+    return model
+
+
+_model = None
+_conn = None
+
+
+def get_connection():
+    """Read-only connection kept open across warm invocations."""
+    global _conn
+    if _conn is None:
+        _conn = open_database()
+    return _conn
+
+
+_cold_start = {}
+
+
+def get_model():
+    """
+    Load the model on first use and keep it for the life of the container: memory-map
+    the packaged artifact when there is a valid one, otherwise build it from student_data.
+    """
+    global _model
+    if _model is None:
+        start = time.perf_counter()
+        source = None
+        if os.path.exists(MODEL_ARTIFACT_FILE):
+            try:
+                _model, source = StudentSuccessModel.load(MODEL_ARTIFACT_FILE), 'artifact'
+                _cold_start['artifact_bytes'] = os.path.getsize(MODEL_ARTIFACT_FILE)
+            except ValueError as e:
+                print(f"model artifact rejected, building from student_data: {e}")
+        if _model is None:
+            _model, source = StudentSuccessModel.from_database(get_connection()), 'student_data'
+        _cold_start.update(model_source=source, verify=MODEL_ARTIFACT_VERIFY,
+                           model_load_ms=round((time.perf_counter() - start) * 1000, 2))
+        print(f"model loaded from {source} in {_cold_start['model_load_ms']} ms: "
+              f"{dict(zip(FEATURE_NAMES, np.round(np.asarray(_model.weights, dtype=float), 3).tolist()))}")
+    return _model
+
+
+def report_cold_start(first_call_started):
+    """Log one COLD START record with the model load and first prediction latency of this container."""
+    if 'first_prediction_ms' in _cold_start or 'model_source' not in _cold_start:
+        return
+    _cold_start.update(
+        first_prediction_ms=round((time.perf_counter() - first_call_started) * 1000, 2),
+        since_module_load_ms=round((time.perf_counter() - _module_loaded_at) * 1000, 2),
+    )
+    print(f"COLD START: {json.dumps(_cold_start)}")
 
 
 def predict_student_success(course_id, student_id):
-    # invoke a predictive model for a given student_id and course_id
-    prediction = 1.0
-
-    
-    return prediction
-     
-    
-def lambda_handler(event, context):   
+    # predicted probability that student_id passes course_id
+    prediction = float(get_model().predict(student_id, [course_id])[0])
+
+    return round(prediction, 3)
+
+
+def parse_course_codes(value):
+    """Accept a JSON list of course codes or a comma-separated string."""
+    try:
+        codes = json.loads(value)
+    except (TypeError, ValueError):
+        codes = str(value).split(',')
+    if isinstance(codes, str):
+        codes = [codes]
+    return list(dict.fromkeys(str(code).strip() for code in codes if str(code).strip()))
+
+
+def predict_student_success_batch(student_id, term=None, course_codes=None, top_k=PREDICTION_TOP_K):
+    """
+    Score every candidate course for a student in one vectorized call and return the
+    top_k by predicted success. Candidates are course_codes when given, otherwise every
+    course offered in term that the student has not already passed.
+
+    :return: dict with the number of candidates and the ranked [(course_code, success_rate)]
+    :raises ValueError: if top_k is less than 1
+    """
+    top_k = int(top_k)
+    if top_k < 1:
+        raise ValueError(f'top_k must be at least 1, got {top_k}')
+    student_id = normalize_student_id(student_id)
+    if course_codes is None:
+        conn = get_connection()
+        passed = {code for code, grade in conn.execute(
+            'SELECT course_code, grade FROM student_data WHERE student_id = ?', (student_id,))
+            if grade in PASSING_GRADES}
+        course_codes = [code for (code,) in conn.execute(
+            'SELECT DISTINCT course_code FROM course_schedule WHERE term = ? ORDER BY course_code', (int(term),))
+            if code not in passed]
+    if not course_codes:
+        return {'student_id': student_id, 'term': term, 'candidates': 0, 'top': []}
+    scores = get_model().predict(student_id, course_codes)
+    top_k = min(top_k, len(scores))
+    # Partial sort: only the top_k scores are ordered
+    top = np.argpartition(-scores, top_k - 1)[:top_k]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return {
+        'student_id': student_id,
+        'term': term,
+        'candidates': len(course_codes),
+        'top': [{'course_code': course_codes[i], 'success_rate': round(float(scores[i]), 3)} for i in top],
+    }
+
+
+def lambda_handler(event, context):
     agent = event['agent']
     actionGroup = event['actionGroup']
     function = event['function']
@@ -26,16 +546,17 @@ def lambda_handler(event, context):
             "body": "Error, no function was called"
         }
     }
-   
+
+    started = time.perf_counter()
     if function == 'predict_student_success':
         course_id = None
         for param in parameters:
             if param["name"] == "course_id":
-                question = param["value"]
+                course_id = param["value"]
 
         if not course_id:
             raise Exception("Missing mandatory parameter: course_id")
-        
+
         student_id = None
         for param in parameters:
             if param["name"] == "student_id":
@@ -43,15 +564,38 @@ def lambda_handler(event, context):
 
         if not student_id:
             raise Exception("Missing mandatory parameter: student_id")
-        
+
         success_rate = predict_student_success(course_id, student_id)
-        
+
         responseBody =  {
             'TEXT': {
                 "body": f"Here is the predicted success rate of {student_id} in {course_id}: {success_rate}"
             }
         }
 
+    elif function == 'predict_student_success_batch':
+        values = {param["name"]: param["value"] for param in parameters}
+
+        if not values.get('student_id'):
+            raise Exception("Missing mandatory parameter: student_id")
+        if not values.get('term') and not values.get('course_codes'):
+            raise Exception("Missing mandatory parameter: term or course_codes")
+
+        ranking = predict_student_success_batch(
+            values['student_id'],
+            term=values.get('term'),
+            course_codes=parse_course_codes(values['course_codes']) if values.get('course_codes') else None,
+            top_k=values.get('top_k') or PREDICTION_TOP_K,
+        )
+
+        responseBody =  {
+            'TEXT': {
+                "body": json.dumps(ranking)
+            }
+        }
+
+    report_cold_start(started)
+
     action_response = {
         'actionGroup': actionGroup,
         'function': function,
@@ -1,65 +1,1091 @@
+import csv
+import io
 import json
 import sqlite3
 import os
+import re
 import shutil
+import time
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-original_db_file = 'porterville_academic.db'
+original_db_file = os.environ.get('ACADEMIC_DB_FILE', 'porterville_academic.db')
 target_db_file = '/tmp/porterville_academic.db'
-if not os.path.exists(target_db_file):
-    shutil.copy2(original_db_file, target_db_file)
-        
-def lambda_handler(event, context):
-    agent = event['agent']
-    actionGroup = event['actionGroup']
-    function = event['function']
-    parameters = event.get('parameters', [])
-    body_text=''
-    if function == 'get_schema':
-        body_text="""
-Table Name 'student_schedule':
-(Column Name, 'student_id', 'TEXT')
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'print_daytime', 'TEXT')
-(Column Name, 'building_number', 'TEXT')
-(Column Name, 'room_number', 'TEXT')
-(Column Name, 'class_days', 'TEXT')
-(Column Name, 'class_start_time', 'REAL')
-(Column Name, 'class_end_time', 'REAL')
 
-<examples>
-Question: Show me the class days for student testuserb to take the BIOE221 course.
-Query: SELECT class_days FROM student_schedule
-WHERE student_id = 'testuserb' AND course_code = 'BIOE221';
-</examples>
+# 'immutable' opens the packaged database in place (read-only, memory-mapped,
+# no locking); 'copy' copies it to /tmp first for workloads that need writes.
+DB_OPEN_MODE = os.environ.get('DB_OPEN_MODE', 'immutable')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AcademicAgent/Text2Sql')
+
+# Per-connection tuning, overridable through the Lambda environment.
+# cache_size is negative so SQLite reads it as KiB rather than pages.
+DB_PRAGMAS = {
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
+# Bookkeeping tables maintained by utils.academic_db that agents never need to query
+SCHEMA_HIDDEN_TABLES = {'ingest_watermark', 'academic_data_version', 'student_summary_course'}
+SCHEMA_SAMPLE_VALUES = int(os.environ.get('SCHEMA_SAMPLE_VALUES', 5))
+MAX_QUERY_COST = float(os.environ.get('MAX_QUERY_COST', 10_000_000))
+QUERY_TIMEOUT_MS = int(os.environ.get('QUERY_TIMEOUT_MS', 5000))
+PROGRESS_HANDLER_OPS = int(os.environ.get('PROGRESS_HANDLER_OPS', 10000))
+# Result budgets keep broad queries from flooding Lambda memory and the agent context.
+# Tokens are approximated as CHARS_PER_TOKEN characters of formatted output.
+RESULT_FORMAT = os.environ.get('RESULT_FORMAT', 'csv')
+MAX_RESULT_ROWS = int(os.environ.get('MAX_RESULT_ROWS', 200))
+MAX_RESULT_BYTES = int(os.environ.get('MAX_RESULT_BYTES', 32 * 1024))
+MAX_RESULT_TOKENS = int(os.environ.get('MAX_RESULT_TOKENS', 6000))
+MAX_COUNTED_ROWS = int(os.environ.get('MAX_COUNTED_ROWS', 100000))
+FETCH_BATCH_SIZE = 256
+CHARS_PER_TOKEN = 4
+STATEMENT_CACHE_SIZE = int(os.environ.get('STATEMENT_CACHE_SIZE', 256))
+STUDENT_ID_WIDTH = int(os.environ.get('STUDENT_ID_WIDTH', 3))
+# Student-facing agents pass the signed-in student's id in this session attribute;
+# their queries then only see that student's rows of SCOPED_TABLES.
+STUDENT_SCOPE_ATTRIBUTE = os.environ.get('STUDENT_SCOPE_ATTRIBUTE', 'student_id')
+SCOPED_TABLES = ['student_data', 'student_schedule', 'student_summary']
+BATCH_MAX_QUERIES = int(os.environ.get('BATCH_MAX_QUERIES', 10))
+BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+INDEX_ADVISOR_THRESHOLD = int(os.environ.get('INDEX_ADVISOR_THRESHOLD', 3))
+QUERY_CACHE_SIZE = int(os.environ.get('QUERY_CACHE_SIZE', 256))
+QUERY_CACHE_TTL_SECONDS = float(os.environ.get('QUERY_CACHE_TTL_SECONDS', 300))
+# Weekly meeting bitmaps have one bit per SLOT_MINUTES of each day
+SLOT_MINUTES = 5
+# Grades that complete a course, as in utils.academic_db
+PASSING_GRADES = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D']
+WEEK_DAYS = ['M', 'T', 'W', 'Th', 'F', 'Sa', 'Su']
+
+# SQLite reads a double-quoted token as a string literal when it names no column,
+# so double-quoted text is kept verbatim like single-quoted strings
+_STRING_LITERAL = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_SPACE_AROUND_PUNCTUATION = re.compile(r"\s*([=<>!,()*+/%|-])\s*")
+_NUMERIC_LITERAL = re.compile(r'(?<![\w.?])-?\d+(?:\.\d+)?(?![\w.])')
+_NAMED_PARAMETER = re.compile(r':(\w+)')
+_NOT_AN_ALIAS = {
+    'as', 'where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'outer',
+    'on', 'using', 'group', 'order', 'limit', 'union', 'except', 'intersect', 'having', 'window',
+}
+_EQUALITY_PREDICATE = re.compile(r'(?:(\w+)\.)?(\w+)\s*(?:==?|\bIN\b|\bIS\b)', re.IGNORECASE)
+_RANGE_PREDICATE = re.compile(r'(?:(\w+)\.)?(\w+)\s*(?:<=?|>=?|\bBETWEEN\b|\bLIKE\b)', re.IGNORECASE)
+_MEETING_DAY = re.compile(r'Th|Sa|Su|M|T|W|F')
+EXPENSIVE_QUERY_HINT = (
+    'Query too expensive, add a filter: restrict it with a selective WHERE clause '
+    '(e.g. on student_id, course_code or term) and join tables on matching columns.'
+)
+
+
+def emit_metric(name, value, unit='Milliseconds', **dimensions):
+    """Print a metric in CloudWatch Embedded Metric Format."""
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions)],
+                'Metrics': [{'Name': name, 'Unit': unit}],
+            }],
+        },
+        name: value,
+        **dimensions,
+    }))
+
+
+# ConnectionManager and the schema introspection below (from _schema_cache to
+# load_schema) are kept identical in course-recommendation-multi-agent/text2sql_lambda_function.py:
+# each Lambda is packaged as a single file, so change both copies together.
+class ConnectionManager:
+    """
+    Keeps one SQLite connection alive across warm Lambda invocations.
+
+    The connection is opened lazily, tuned with DB_PRAGMAS, and re-validated
+    with a trivial statement before it is handed out, so a broken connection
+    is transparently replaced instead of failing the agent turn.
+    """
+
+    def __init__(self, db_file, pragmas=None, readonly=True, immutable=False, setup=None):
+        self.db_file = db_file
+        self.pragmas = dict(DB_PRAGMAS if pragmas is None else pragmas)
+        self.readonly = readonly
+        self.immutable = immutable
+        # Optional callable run on every new connection, e.g. to create temp views
+        self.setup = setup
+        self._conn = None
+
+    def _connect(self):
+        uri = f'file:{os.path.abspath(self.db_file)}?mode={"ro" if self.readonly else "rw"}'
+        if self.immutable:
+            uri += '&immutable=1'
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        if self.setup is not None:
+            self.setup(conn)
+        return conn
+
+    def get(self):
+        if self._conn is not None:
+            try:
+                self._conn.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                self.close()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+
+def open_database():
+    """Open the academic database according to DB_OPEN_MODE and report how long it took."""
+    start = time.perf_counter()
+    if DB_OPEN_MODE == 'copy':
+        if not os.path.exists(target_db_file):
+            shutil.copy2(original_db_file, target_db_file)
+        manager = ConnectionManager(target_db_file, readonly=False)
+    elif DB_OPEN_MODE == 'immutable':
+        manager = ConnectionManager(original_db_file, immutable=True)
+    else:
+        raise ValueError("Invalid DB_OPEN_MODE. Choose either 'immutable' or 'copy'.")
+    manager.get()
+    emit_metric('ColdStartDbReadyMs', (time.perf_counter() - start) * 1000, DbOpenMode=DB_OPEN_MODE)
+    return manager
+
+
+db = open_database()
+
+
+def normalize_sql(query):
+    """
+    Canonicalize a SQL statement so that queries differing only in whitespace,
+    keyword/identifier casing or a trailing semicolon compare equal.
+    String literals and double-quoted text are kept verbatim because their contents
+    are significant.
+    """
+    parts = _STRING_LITERAL.split(query.strip().rstrip(';'))
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            normalized.append(part)
+        else:
+            part = ' '.join(part.split()).lower()
+            normalized.append(_SPACE_AROUND_PUNCTUATION.sub(r'\1', part).strip())
+    return ' '.join(p for p in normalized if p)
+
+
+def sql_fingerprint(query):
+    return hashlib.sha1(normalize_sql(query).encode('utf-8')).hexdigest()
+
+
+def cache_key(text):
+    """Cache key of text taken exactly as given, for keys that hold values rather than SQL."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def data_version_token(conn, db_file):
+    """Cheap token that changes whenever the database content may have changed."""
+    data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+    # Bumped by utils.academic_db on every rebuild or incremental ingest
+    try:
+        ingest_version = conn.execute('SELECT version FROM academic_data_version').fetchone()[0]
+    except sqlite3.OperationalError:
+        ingest_version = None
+    stat = os.stat(db_file)
+    return (data_version, ingest_version, stat.st_mtime_ns, stat.st_size)
 
---------------------------------------------------------
 
-Table Name 'course_schedule':
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'print_daytime', 'TEXT')
-(Column Name, 'building_number', 'TEXT')
-(Column Name, 'room_number', 'TEXT')
-(Column Name, 'class_days', 'TEXT')
-(Column Name, 'class_start_time', 'REAL')
-(Column Name, 'class_end_time', 'REAL')
+class QueryCache:
+    """
+    LRU result cache with a per-entry TTL, keyed on the SQL fingerprint.
+    All entries are dropped as soon as the data version token changes.
+    """
 
---------------------------------------------------------
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Batch queries may run on several threads
+        self._lock = threading.Lock()
 
-Table Name 'student_data':
-(Column Name, 'student_id', 'INTEGER')
-(Column Name, 'term', 'INTEGER')
-(Column Name, 'course_code', 'TEXT')
-(Column Name, 'credits', 'REAL')
-(Column Name, 'grade', 'TEXT')
-(Column Name, 'major', 'TEXT')
+    def validate(self, version):
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+
+query_cache = QueryCache()
+
+SCHEMA_GUIDANCE = """
+<examples>
+Question: Show me the class days for student 1 to take the BIOL P110 course.
+Query: SELECT class_days FROM student_schedule
+WHERE student_id = '001' AND course_code = 'BIOL P110';
+</examples>
 
 <query-principle>
 1. Don't make up column names.
+2. Match the column types and value formats shown in the sample values (e.g. student_id '001', class_start_time 900 means 9:00am).
+3. Filter on indexed columns where possible so lookups stay selective.
+4. Use student_summary for a student's GPA, earned credits and latest major instead of aggregating student_data.
+5. Use course_prerequisite (a course needs every group_no; any required_course of a group meets it; non_course = 1 means the group can also be met by placement or an equivalent, see course_catalog.prerequisite) for prerequisites.
 </query-principle>
 """
+
+_schema_cache = {'version': None, 'schema': None, 'text': None}
+# Batch queries may load the schema on several threads
+_schema_lock = threading.Lock()
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def introspect_schema(conn):
+    """
+    Describe every user table from sqlite_master: columns, indexes, approximate size and sample values.
+    Everything is read from the main schema so per-student views never skew the description.
+    """
+    schema = {}
+    tables = conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    ).fetchall()
+    for (table,) in tables:
+        if table in SCHEMA_HIDDEN_TABLES:
+            continue
+        columns = [(row[1], row[2] or 'ANY') for row in conn.execute(f'PRAGMA main.table_info({_quote(table)})')]
+        indexes = []
+        for _, index_name, unique, *_ in conn.execute(f'PRAGMA main.index_list({_quote(table)})'):
+            # Expression columns (e.g. ifnull(class_days, '') in a natural key index) have no name
+            index_columns = [row[2] or '<expression>'
+                             for row in conn.execute(f'PRAGMA main.index_info({_quote(index_name)})')]
+            indexes.append((index_name, index_columns, bool(unique)))
+        # max(rowid) is an O(log n) stand-in for count(*) on append-only tables
+        try:
+            row_count = conn.execute(f'SELECT max(rowid) FROM main.{_quote(table)}').fetchone()[0] or 0
+        except sqlite3.OperationalError:
+            row_count = conn.execute(f'SELECT count(*) FROM main.{_quote(table)}').fetchone()[0]
+        samples = {}
+        for column, column_type in columns:
+            # Binary columns (e.g. the passed-course bitmap) have no readable sample values
+            if column_type == 'BLOB':
+                samples[column] = []
+                continue
+            samples[column] = [row[0] for row in conn.execute(
+                f'SELECT DISTINCT {_quote(column)} FROM main.{_quote(table)} '
+                f'WHERE {_quote(column)} IS NOT NULL LIMIT {SCHEMA_SAMPLE_VALUES}'
+            )]
+        schema[table] = {'columns': columns, 'indexes': indexes, 'row_count': row_count, 'samples': samples}
+    return schema
+
+
+def render_schema(schema):
+    sections = []
+    for table, info in schema.items():
+        lines = [f"Table Name '{table}' (~{info['row_count']} rows):"]
+        for column, column_type in info['columns']:
+            sample = ', '.join(repr(value) for value in info['samples'][column])
+            lines.append(f"(Column Name, '{column}', '{column_type}'" + (f", e.g. {sample})" if sample else ')'))
+        if info['indexes']:
+            lines.append('Indexes:')
+            for index_name, index_columns, unique in info['indexes']:
+                lines.append(f"({'UNIQUE ' if unique else ''}Index, '{index_name}', ({', '.join(index_columns)}))")
+        sections.append('\n'.join(lines))
+    return '\n\n--------------------------------------------------------\n\n'.join(sections) + '\n' + SCHEMA_GUIDANCE
+
+
+def load_schema(conn):
+    """Return the introspected schema, rebuilding it only when the data version changes."""
+    version = data_version_token(conn, db.db_file)
+    with _schema_lock:
+        if _schema_cache['version'] != version:
+            schema = introspect_schema(conn)
+            _schema_cache.update(version=version, schema=schema, text=render_schema(schema))
+        return _schema_cache['schema']
+
+
+def get_schema_description(conn):
+    load_schema(conn)
+    return _schema_cache['text']
+
+
+class QueryTooExpensive(Exception):
+    """Raised when agent SQL is rejected by the cost guard or exceeds its time budget."""
+
+    def __init__(self, reason, **details):
+        super().__init__(reason)
+        self.reason = reason
+        self.details = details
+
+    def to_json(self):
+        return json.dumps({'error': 'query_too_expensive', 'reason': self.reason,
+                           'hint': EXPENSIVE_QUERY_HINT, **self.details})
+
+
+def _table_aliases(query, tables):
+    aliases = {table.lower(): table for table in tables}
+    for table in tables:
+        for match in re.finditer(rf'\b{re.escape(table)}\b\s+(?:as\s+)?(\w+)', query, re.IGNORECASE):
+            alias = match.group(1).lower()
+            if alias not in _NOT_AN_ALIAS:
+                aliases[alias] = table
+    return aliases
+
+
+def check_query_cost(conn, query, max_cost=MAX_QUERY_COST):
+    """
+    Estimate the cost of the top-level join loop from EXPLAIN QUERY PLAN and
+    reject cross joins of two or more full table scans above max_cost.
+    A full scan contributes the table's row count, an index search log2 of it.
+    """
+    schema = load_schema(conn)
+    aliases = _table_aliases(query, list(schema))
+    cost = 1.0
+    full_scans = []
+    for _, parent, _, detail in conn.execute('EXPLAIN QUERY PLAN ' + query):
+        if parent != 0:
+            continue
+        operation, _, rest = detail.partition(' ')
+        # Tables read through a view are reported with their schema, e.g. main.student_data
+        table = aliases.get(rest.split(' ')[0].lower().split('.')[-1])
+        if table is None or operation not in ('SCAN', 'SEARCH'):
+            continue
+        rows = max(schema[table]['row_count'], 1)
+        if operation == 'SCAN':
+            full_scans.append(table)
+            cost *= rows
+        else:
+            cost *= max(rows.bit_length(), 1)
+    if len(full_scans) > 1 and cost > max_cost:
+        raise QueryTooExpensive('estimated cost above limit', estimated_cost=int(cost),
+                                max_cost=int(max_cost), full_scans=full_scans)
+    return cost, full_scans
+
+
+class IndexAdvisor:
+    """
+    Watches the queries the agent runs and recommends indexes for filter
+    predicates that keep hitting full table scans.
+
+    Each observation and recommendation is logged as an 'INDEX ADVISOR' line;
+    utils.academic_db.build_recommended_indexes() builds the recommended
+    indexes offline from those logs, since the Lambda's database is read-only.
+    """
+
+    def __init__(self, threshold=INDEX_ADVISOR_THRESHOLD):
+        self.threshold = threshold
+        self.counts = Counter()
+        self.recommended = {}
+        # Batch queries may report full scans on several threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def predicate_columns(query, table, columns, aliases):
+        """Columns of table used in filters, equality predicates first, then ranges."""
+        # Blank out string values; double-quoted text may be an identifier, so only unquote it
+        query = _STRING_LITERAL.sub(lambda m: "''" if m.group(0)[0] == "'" else m.group(0)[1:-1], query)
+        known = {column.lower(): column for column in columns}
+        found = []
+        for pattern in (_EQUALITY_PREDICATE, _RANGE_PREDICATE):
+            for qualifier, name in pattern.findall(query):
+                column = known.get(name.lower())
+                if column is None or column in found:
+                    continue
+                if qualifier and aliases.get(qualifier.lower()) != table:
+                    continue
+                found.append(column)
+        return found
+
+    def observe(self, query, full_scans, schema, aliases):
+        for table in full_scans:
+            columns = [column for column, _ in schema[table]['columns']]
+            predicates = self.predicate_columns(query, table, columns, aliases)
+            if not predicates:
+                continue
+            key = (table, tuple(predicates))
+            with self._lock:
+                self.counts[key] += 1
+                seen = self.counts[key]
+                recommend = seen >= self.threshold and key not in self.recommended
+                if recommend:
+                    ddl = (f"CREATE INDEX IF NOT EXISTS idx_advisor_{table}_{'_'.join(predicates)} "
+                           f"ON {table} ({', '.join(predicates)})")
+                    self.recommended[key] = ddl
+            print('INDEX ADVISOR: ' + json.dumps({'table': table, 'columns': predicates, 'seen': seen,
+                                                  'query': normalize_sql(query)}))
+            if recommend:
+                print('INDEX ADVISOR: ' + json.dumps({'recommendation': ddl, 'seen': seen}))
+
+    def recommendations(self):
+        with self._lock:
+            return list(self.recommended.values())
+
+
+index_advisor = IndexAdvisor()
+
+# Statements that can only read, after any leading comments
+_READ_STATEMENT = re.compile(r'^(?:\s|--[^\n]*(?:\n|$)|/\*.*?\*/)*(?:select|with|values)\b', re.I | re.S)
+_READ_ONLY_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+READ_ONLY_MESSAGE = 'only read-only SELECT statements are allowed'
+
+
+def _read_only_authorizer(action, arg1, arg2, db_name, source):
+    # The cost guard checks the data version while the authorizer is installed
+    if action == sqlite3.SQLITE_PRAGMA and arg1 == 'data_version' and arg2 is None:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_OK if action in _READ_ONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def is_read_only(conn, query):
+    """
+    Reject anything but a SELECT (or WITH/VALUES) statement, then compile it under an
+    authorizer that only permits reads, without running it.
+    """
+    if not _READ_STATEMENT.match(query):
+        return False
+    conn.set_authorizer(_read_only_authorizer)
+    try:
+        conn.execute('EXPLAIN QUERY PLAN ' + query).fetchall()
+    except sqlite3.DatabaseError as e:
+        # Other errors (syntax, unknown columns) are reported when the query is run
+        return 'not authorized' not in str(e)
+    finally:
+        conn.set_authorizer(None)
+    return True
+
+
+def run_sql_query(conn, query, scope=None, authorizer=_read_only_authorizer):
+    """
+    Run one agent query through the result cache, the cost guard and the time budget.
+    Only SELECT (or WITH/VALUES) statements are run, under a read-only authorizer, so
+    agent SQL cannot change the database even when it is opened read-write.
+
+    :param scope: student id the connection is scoped to; part of the cache key
+    :param authorizer: SQLite authorizer enforced while the agent's statement is compiled and run
+    :return: (result body, cache status 'hit', 'miss', or None if the statement was rejected)
+    """
+    if not _READ_STATEMENT.match(query):
+        return READ_ONLY_MESSAGE, None
+    # Serve repeated queries from the result cache while the data is unchanged
+    query_cache.validate(data_version_token(conn, db.db_file))
+    cache_key = sql_fingerprint(query) + (f':{scope}' if scope is not None else '')
+    rows = query_cache.get(cache_key)
+    if rows is not None:
+        return rows, 'hit'
+
+    # Create a cursor object
+    cursor = conn.cursor()
+    load_schema(conn)
+
+    # Execute the query within the cost guard and time budget
+    try:
+        conn.set_authorizer(authorizer)
+        _, full_scans = check_query_cost(conn, query)
+        if full_scans:
+            schema = load_schema(conn)
+            index_advisor.observe(query, full_scans, schema, _table_aliases(query, list(schema)))
+        # Stream a bounded, compact result
+        rows = run_with_time_budget(conn, lambda: format_result(cursor.execute(query)))
+        query_cache.put(cache_key, rows)
+    except QueryTooExpensive as e:
+        rows = e.to_json()
+    except (sqlite3.Error, sqlite3.Warning) as e:
+        # sqlite3.Warning: more than one statement in the query
+        rows = f'query is incorrect ({e}), please check column name and re-generate'
+    finally:
+        conn.set_authorizer(None)
+        cursor.close()
+    return rows, 'miss'
+
+
+# Student the scoped connection's views currently return, read by scoped_student_id()
+_student_scope = {'student_id': None}
+
+
+def install_student_scope(conn):
+    """
+    Shadow each scoped table with a temp view restricted to the student returned by
+    scoped_student_id(). The function is deterministic, so SQLite evaluates it once
+    per statement and lookups still use the student_id indexes; the view SQL never
+    changes between requests. Switching students writes nothing, so the connection
+    never holds a transaction (and a stale read snapshot) between requests.
+    """
+    conn.create_function('scoped_student_id', 0, lambda: _student_scope['student_id'], deterministic=True)
+    for table in SCOPED_TABLES:
+        conn.execute(
+            f'CREATE TEMP VIEW {table} AS SELECT * FROM main.{table} '
+            f'WHERE student_id = scoped_student_id()'
+        )
+
+
+def _student_scope_authorizer(action, arg1, arg2, db_name, source):
+    """Read-only, and scoped tables may only be read through their per-student view."""
+    # Column reads are most of the calls (a view expands to every column), so they are decided first
+    if action == sqlite3.SQLITE_READ:
+        if source is None and db_name == 'main' and arg1 in SCOPED_TABLES:
+            return sqlite3.SQLITE_DENY
+        return sqlite3.SQLITE_OK
+    return _read_only_authorizer(action, arg1, arg2, db_name, source)
+
+
+# Separate connection for student-scoped requests so unscoped agents never see the views
+scoped_db = ConnectionManager(db.db_file, readonly=True, immutable=db.immutable, setup=install_student_scope)
+
+
+def run_scoped_sql_query(student_id, query):
+    """Run an agent query that may only see the rows of one student."""
+    student_id = normalize_template_value('student_id', student_id)
+    conn = scoped_db.get()
+    _student_scope['student_id'] = student_id
+    return run_sql_query(conn, query, scope=student_id, authorizer=_student_scope_authorizer)
+
+
+# Named, parameterized statements for the most common academic questions. Each is
+# exposed as its own function on the action group so the agent can skip SQL generation;
+# sqlite3 keeps the compiled statements in the connection's statement cache, so warm
+# calls skip SQL parsing too. Free-form sql_query calls that have the same shape as a
+# template are also routed here with their literals bound as parameters.
+QUERY_TEMPLATES = {
+    'get_student_course_history': {
+        'description': 'courses a student has taken, with term, credits and grade',
+        'sql': 'SELECT term, course_code, credits, grade, major FROM student_data '
+               'WHERE student_id = :student_id ORDER BY term, course_code',
+    },
+    'get_student_current_schedule': {
+        'description': 'courses a student is enrolled in for a term, with meeting days and times',
+        'sql': 'SELECT course_code, print_daytime, building_number, room_number, class_days, '
+               'class_start_time, class_end_time FROM student_schedule '
+               'WHERE student_id = :student_id AND term = :term ORDER BY class_start_time',
+    },
+    'get_course_offerings': {
+        'description': 'sections offered for a course in a term, with meeting days, times and location',
+        'sql': 'SELECT term, course_code, print_daytime, building_number, room_number, class_days, '
+               'class_start_time, class_end_time FROM course_schedule '
+               'WHERE course_code = :course_code AND term = :term ORDER BY class_start_time',
+    },
+}
+
+
+def _template_shape(sql):
+    return _NAMED_PARAMETER.sub('?', normalize_sql(sql))
+
+
+_TEMPLATE_SHAPES = {
+    _template_shape(template['sql']): (name, _NAMED_PARAMETER.findall(template['sql']))
+    for name, template in QUERY_TEMPLATES.items()
+}
+
+
+def normalize_template_value(name, value):
+    if name == 'student_id':
+        value = str(value).strip()
+        return value.zfill(STUDENT_ID_WIDTH) if value.isdigit() else value
+    if name == 'term':
+        return int(value)
+    return str(value).strip()
+
+
+def match_template(query):
+    """
+    Return (template name, parameter values) when a free-form query has exactly the
+    shape of a registered template once its literals are lifted out, else None.
+    Only the INTEGER term parameter may be given as a bare number: a number compared
+    with a TEXT column matches nothing in SQLite, so such queries are left to run
+    as written instead of being bound (and zero-padded) as a string.
+    """
+    literals = []
+
+    def lift(match):
+        literals.append((match.group(0), False))
+        return '?'
+
+    parts = _STRING_LITERAL.split(query.strip().rstrip(';'))
+    shape_parts = []
+    for i, part in enumerate(parts):
+        if i % 2:
+            quote = part[0]
+            literals.append((part[1:-1].replace(quote * 2, quote), True))
+            shape_parts.append('?')
+        else:
+            shape_parts.append(_NUMERIC_LITERAL.sub(lift, normalize_sql(part)) if part.strip() else '')
+    match = _TEMPLATE_SHAPES.get(normalize_sql(' '.join(shape_parts)))
+    if match is None:
+        return None
+    name, parameter_names = match
+    if any(not quoted and parameter != 'term' for parameter, (_, quoted) in zip(parameter_names, literals)):
+        return None
+    return name, {parameter: value for parameter, (value, _) in zip(parameter_names, literals)}
+
+
+def run_template(conn, name, values, student_scope=None):
+    """
+    Run a registered template with bound parameters through the result cache and time budget.
+    In a student-scoped session the student_id parameter is always the scoped student.
+
+    :return: (result body, cache status 'hit' or 'miss')
+    """
+    sql = QUERY_TEMPLATES[name]['sql']
+    if student_scope and 'student_id' in values:
+        values = {**values, 'student_id': student_scope}
+    values = {key: normalize_template_value(key, value) for key, value in values.items()}
+    query_cache.validate(data_version_token(conn, db.db_file))
+    key = cache_key(name + ':' + json.dumps(values, sort_keys=True))
+    rows = query_cache.get(key)
+    if rows is not None:
+        return rows, 'hit'
+    cursor = conn.cursor()
+    try:
+        rows = run_with_time_budget(conn, lambda: format_result(cursor.execute(sql, values)))
+        query_cache.put(key, rows)
+    except QueryTooExpensive as e:
+        rows = e.to_json()
+    finally:
+        cursor.close()
+    return rows, 'miss'
+
+
+_summary_courses = {'version': None, 'codes': {}}
+
+
+def load_summary_courses(conn):
+    """Return bit -> course_code for decoding student_summary.passed_courses, reloaded when the data changes."""
+    version = data_version_token(conn, db.db_file)
+    if _summary_courses['version'] != version:
+        codes = dict((bit, code) for code, bit in conn.execute('SELECT course_code, bit FROM main.student_summary_course'))
+        _summary_courses.update(version=version, codes=codes)
+    return _summary_courses['codes']
+
+
+def decode_course_bitmap(bitmap, codes):
+    value = int.from_bytes(bitmap or b'', 'little')
+    return sorted(codes[bit] for bit in range(value.bit_length()) if value >> bit & 1)
+
+
+def get_student_summary(conn, student_id):
+    """
+    One-row academic summary of a student from the precomputed student_summary
+    table: GPA by term, cumulative GPA, credits, passed courses and latest major.
+
+    :return: (JSON result body, cache status 'hit' or 'miss')
+    """
+    student_id = normalize_template_value('student_id', student_id)
+    query_cache.validate(data_version_token(conn, db.db_file))
+    key = cache_key('get_student_summary:' + student_id)
+    body = query_cache.get(key)
+    if body is not None:
+        return body, 'hit'
+    try:
+        row = conn.execute(
+            'SELECT student_id, latest_term, latest_major, terms_enrolled, attempted_credits, earned_credits, '
+            'cumulative_gpa, gpa_by_term, passed_courses FROM main.student_summary WHERE student_id = ?',
+            (student_id,),
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return 'student_summary is not available, use sql_query on student_data instead', 'miss'
+    if row is None:
+        body = json.dumps({'student_id': student_id, 'found': False})
+    else:
+        body = json.dumps({
+            'student_id': row[0], 'latest_term': row[1], 'latest_major': row[2], 'terms_enrolled': row[3],
+            'attempted_credits': row[4], 'earned_credits': row[5], 'cumulative_gpa': row[6],
+            'gpa_by_term': json.loads(row[7] or '{}'),
+            'passed_courses': decode_course_bitmap(row[8], load_summary_courses(conn)),
+        })
+    query_cache.put(key, body)
+    return body, 'miss'
+
+
+def meeting_bitmap(class_days, start_time, end_time):
+    """
+    Encode a section's weekly meetings as an int bitset with one bit per SLOT_MINUTES
+    of the week, so two sections overlap exactly when their bitmaps share a bit.
+    Sections without days or times (e.g. online or TBA) get an empty bitmap.
+    """
+    if not class_days or start_time is None or end_time is None:
+        return 0
+    start = (int(start_time) // 100 * 60 + int(start_time) % 100) // SLOT_MINUTES
+    end = -(-(int(end_time) // 100 * 60 + int(end_time) % 100) // SLOT_MINUTES)
+    if end <= start:
+        return 0
+    slots_per_day = 24 * 60 // SLOT_MINUTES
+    meeting = (1 << (end - start)) - 1
+    bitmap = 0
+    for day in _MEETING_DAY.findall(class_days):
+        bitmap |= meeting << (WEEK_DAYS.index(day) * slots_per_day + start)
+    return bitmap
+
+
+_section_bitmaps = {'version': None, 'terms': {}}
+
+
+def load_section_bitmaps(conn, term):
+    """Return [(rowid, course_code, bitmap)] for every section offered in term, parsed once per data version."""
+    version = data_version_token(conn, db.db_file)
+    if _section_bitmaps['version'] != version:
+        _section_bitmaps.update(version=version, terms={})
+    if term not in _section_bitmaps['terms']:
+        _section_bitmaps['terms'][term] = [
+            (rowid, course_code, meeting_bitmap(class_days, start_time, end_time))
+            for rowid, course_code, class_days, start_time, end_time in conn.execute(
+                'SELECT rowid, course_code, class_days, class_start_time, class_end_time '
+                'FROM main.course_schedule WHERE term = ?', (term,))
+        ]
+    return _section_bitmaps['terms'][term]
+
+
+def get_conflict_free_sections(conn, student_id, term):
+    """
+    Sections offered in term that do not overlap any class the student is enrolled in
+    that term, excluding courses the student is already taking. The student's classes
+    are OR-ed into one weekly bitmap and every section is tested against it with a
+    single AND, instead of the agent comparing day strings and times in SQL.
+
+    :return: (result body, cache status 'hit' or 'miss')
+    """
+    student_id = normalize_template_value('student_id', student_id)
+    term = normalize_template_value('term', term)
+    query_cache.validate(data_version_token(conn, db.db_file))
+    key = cache_key(f'get_conflict_free_sections:{student_id}:{term}')
+    rows = query_cache.get(key)
+    if rows is not None:
+        return rows, 'hit'
+
+    busy = 0
+    enrolled = set()
+    for course_code, class_days, start_time, end_time in conn.execute(
+            'SELECT course_code, class_days, class_start_time, class_end_time FROM main.student_schedule '
+            'WHERE student_id = ? AND term = ?', (student_id, term)):
+        busy |= meeting_bitmap(class_days, start_time, end_time)
+        enrolled.add(course_code)
+    free = [rowid for rowid, course_code, bitmap in load_section_bitmaps(conn, term)
+            if not bitmap & busy and course_code not in enrolled]
+
+    cursor = conn.cursor()
+    try:
+        rows = format_result(cursor.execute(
+            'SELECT course_code, print_daytime, building_number, room_number, class_days, '
+            'class_start_time, class_end_time FROM main.course_schedule '
+            'WHERE rowid IN (SELECT value FROM json_each(?)) ORDER BY course_code, class_start_time',
+            (json.dumps(free),)))
+        query_cache.put(key, rows)
+    finally:
+        cursor.close()
+    return rows, 'miss'
+
+
+_prerequisite_graph = {'version': None, 'groups': {}, 'printed': {}, 'non_course': set()}
+
+
+def load_prerequisite_graph(conn):
+    """
+    Return (course_code -> requirement groups, course_code -> printed prerequisite) from
+    course_prerequisite and course_catalog, reloaded when the data changes. Each group
+    is a tuple of (required_course, concurrent) alternatives; groups that can also be
+    met without a course (placement, "or equivalent") are listed in non_course.
+
+    :return: (groups, printed, non_course set of (course_code, group index))
+    """
+    version = data_version_token(conn, db.db_file)
+    if _prerequisite_graph['version'] != version:
+        groups, non_course = {}, set()
+        for course_code, group_no, required_course, concurrent, other in conn.execute(
+                'SELECT course_code, group_no, required_course, concurrent, non_course FROM main.course_prerequisite '
+                'ORDER BY course_code, group_no'):
+            course_groups = groups.setdefault(course_code, {})
+            course_groups[group_no] = course_groups.get(group_no, ()) + ((required_course, bool(concurrent)),)
+            if other:
+                non_course.add((course_code, list(course_groups).index(group_no)))
+        printed = dict(conn.execute(
+            'SELECT course_code, prerequisite FROM main.course_catalog WHERE prerequisite IS NOT NULL'))
+        _prerequisite_graph.update(version=version, printed=printed, non_course=non_course,
+                                   groups={code: list(course_groups.values()) for code, course_groups in groups.items()})
+    return _prerequisite_graph['groups'], _prerequisite_graph['printed'], _prerequisite_graph['non_course']
+
+
+def completed_requirements(completed, groups, non_course=frozenset()):
+    """
+    Walk the graph down from the completed courses: every requirement group of a
+    completed course must have been met, so a single-alternative group adds its course
+    (MATH P104 implies MATH P103) and a group with alternatives is recorded as met
+    (MATH P103 implies one of MATH P101 or MATH P101A, without telling which).
+    Groups in non_course may have been met by placement instead and imply nothing.
+
+    :return: (implied completed courses, list of met alternative sets)
+    """
+    implied, met, stack = set(completed), [], list(completed)
+    while stack:
+        course_code = stack.pop()
+        for index, group in enumerate(groups.get(course_code, ())):
+            if (course_code, index) in non_course:
+                continue
+            if len(group) > 1:
+                met.append(frozenset(code for code, _ in group))
+            elif group[0][0] not in implied:
+                implied.add(group[0][0])
+                stack.append(group[0][0])
+    return implied, met
+
+
+def eligible_courses(conn, student_id, term):
+    """
+    Courses offered in term that the student can enroll in according to the catalog
+    prerequisites: every requirement group has an alternative the student completed
+    before term (or, for co-requisites, is enrolled in that term). Courses the student
+    already passed or is enrolled in are left out.
+
+    Every course with a printed prerequisite is listed under conditions with that
+    text, since placement and program requirements are not part of the graph. A
+    course is only eligible if the student completed its required courses. If the
+    unmet groups can also be met without a course ("or equivalent", "or higher",
+    "or appropriate placement"), it stays under conditions with those groups as
+    missing. Otherwise it is blocked, with its missing groups and printed prerequisite.
+
+    :return: (JSON result body, cache status 'hit' or 'miss')
+    """
+    student_id = normalize_template_value('student_id', student_id)
+    term = normalize_template_value('term', term)
+    query_cache.validate(data_version_token(conn, db.db_file))
+    key = cache_key(f'eligible_courses:{student_id}:{term}')
+    body = query_cache.get(key)
+    if body is not None:
+        return body, 'hit'
+    try:
+        groups, printed, non_course = load_prerequisite_graph(conn)
+    except sqlite3.OperationalError:
+        return 'course_prerequisite is not available, build it with utils.course_catalog', 'miss'
+
+    passed = {code for (code,) in conn.execute(
+        f'SELECT course_code FROM main.student_data WHERE student_id = ? AND term < ? '
+        f'AND grade IN ({", ".join("?" for _ in PASSING_GRADES)})', (student_id, term, *PASSING_GRADES))}
+    enrolled = {code for (code,) in conn.execute(
+        'SELECT course_code FROM main.student_schedule WHERE student_id = ? AND term = ?', (student_id, term))}
+    completed, met = completed_requirements(passed, groups, non_course)
+
+    eligible, conditions, blocked = [], {}, []
+    for course_code in sorted({code for _, code, _ in load_section_bitmaps(conn, term)} - passed - enrolled):
+        missing = [index for index, group in enumerate(groups.get(course_code, ()))
+                   if not any(code in completed or (concurrent and code in enrolled) for code, concurrent in group)
+                   and not any(alternatives <= {code for code, _ in group} for alternatives in met)]
+        missing_courses = [sorted(code for code, _ in groups[course_code][index]) for index in missing]
+        if any((course_code, index) not in non_course for index in missing):
+            blocked.append({'course_code': course_code, 'missing': missing_courses,
+                            'prerequisite': printed.get(course_code)})
+        elif missing:
+            conditions[course_code] = {'prerequisite': printed.get(course_code), 'missing': missing_courses}
+        else:
+            eligible.append(course_code)
+            if course_code in printed:
+                conditions[course_code] = {'prerequisite': printed[course_code]}
+    body = json.dumps({'student_id': student_id, 'term': term, 'completed_courses': len(passed),
+                       'eligible': eligible, 'conditions': conditions, 'blocked': blocked})
+    query_cache.put(key, body)
+    return body, 'miss'
+
+
+# Extra read connections for running batch statements in parallel
+_batch_connections = [ConnectionManager(db.db_file, immutable=db.immutable) for _ in range(BATCH_MAX_WORKERS)]
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS) if BATCH_MAX_WORKERS > 1 else None
+
+
+def split_sql_statements(text):
+    """
+    Split text on the semicolons that end statements. sqlite3.complete_statement()
+    decides where a statement ends, so semicolons in string literals, quoted
+    identifiers and comments do not split it.
+    """
+    statements = []
+    current = ''
+    for piece in text.split(';'):
+        current += piece
+        if sqlite3.complete_statement(current + ';'):
+            if current.strip():
+                statements.append(current.strip())
+            current = ''
+        else:
+            current += ';'
+    if current.strip(' \t\r\n;'):
+        statements.append(current.strip())
+    return statements
+
+
+def parse_batch_queries(value):
+    """
+    Accept a JSON array of SQL strings, a JSON object of label -> SQL, or plain SQL
+    with the statements separated by semicolons; return a list of (label, query)
+    pairs. Items that are not strings are kept and rejected per query by the batch.
+    """
+    try:
+        queries = json.loads(value)
+    except (TypeError, ValueError):
+        queries = str(value)
+    if isinstance(queries, str):
+        queries = split_sql_statements(queries)
+    if isinstance(queries, dict):
+        labeled = [(str(label), query) for label, query in queries.items()]
+    elif isinstance(queries, list):
+        labeled = [(f'query_{i}', query) for i, query in enumerate(queries, start=1)]
+    else:
+        raise Exception("Invalid parameter: queries must be a JSON array of SQL strings or SQL separated by ';'")
+    if not labeled:
+        raise Exception("Missing mandatory parameter: queries")
+    if len(labeled) > BATCH_MAX_QUERIES:
+        raise Exception(f"Too many queries in one batch: {len(labeled)} (maximum {BATCH_MAX_QUERIES})")
+    return labeled
+
+
+def run_sql_query_batch(labeled_queries, parallel=False, student_scope=None):
+    """
+    Run several read-only statements in one invocation, on the shared connection or,
+    with parallel=True, on separate read connections (sqlite3 releases the GIL while
+    a statement runs). Student-scoped batches run sequentially on the scoped
+    connection. Returns [(label, body, cache status)] in the input order.
+    """
+    def run(label, query, manager):
+        if not isinstance(query, str):
+            return label, f'query must be a SQL string, got {type(query).__name__}', None
+        conn = manager.get()
+        if not is_read_only(conn, query):
+            return label, READ_ONLY_MESSAGE, None
+        if student_scope:
+            body, status = run_scoped_sql_query(student_scope, query)
+        else:
+            body, status = run_sql_query(conn, query)
+        return label, body, status
+
+    if student_scope:
+        return [run(label, query, scoped_db) for label, query in labeled_queries]
+    if parallel and _batch_executor is not None and len(labeled_queries) > 1:
+        futures = [
+            _batch_executor.submit(run, label, query, _batch_connections[i % len(_batch_connections)])
+            for i, (label, query) in enumerate(labeled_queries)
+        ]
+        return [future.result() for future in futures]
+    return [run(label, query, db) for label, query in labeled_queries]
+
+
+def format_result(cursor, result_format=RESULT_FORMAT, max_rows=MAX_RESULT_ROWS,
+                  max_bytes=MAX_RESULT_BYTES, max_tokens=MAX_RESULT_TOKENS):
+    """
+    Stream an executed cursor in fetchmany batches into a compact text result.
+
+    Rows are kept until the row, byte or token budget is reached; the rest of
+    the result set is only counted (up to MAX_COUNTED_ROWS) so the agent learns
+    how much was left out. Sizes are measured in UTF-8 bytes, which is what the
+    Lambda response limit counts. 'csv' emits a header line plus CSV rows,
+    'json' emits column-oriented JSON.
+    """
+    if result_format not in ('csv', 'json'):
+        raise ValueError("Invalid result format. Choose either 'csv' or 'json'.")
+    columns = [description[0] for description in cursor.description or []]
+    byte_budget = min(max_bytes, max_tokens * CHARS_PER_TOKEN)
+    # Each CSV row is written to line first so its encoded size is known before it is kept
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator='\n')
+    writer.writerow(columns)
+    lines = [line.getvalue()]
+    data = [[] for _ in columns]
+    used = len(lines[0].encode('utf-8'))
+    returned = total = 0
+    truncated = False
+
+    while columns:
+        batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+        if not batch:
+            break
+        for row in batch:
+            total += 1
+            if truncated:
+                continue
+            if result_format == 'csv':
+                line.seek(0)
+                line.truncate()
+                writer.writerow(row)
+                text = line.getvalue()
+            else:
+                text = json.dumps(row, default=str) + ','
+            size = len(text.encode('utf-8'))
+            if returned >= max_rows or used + size > byte_budget:
+                truncated = True
+                continue
+            if result_format == 'csv':
+                lines.append(text)
+            else:
+                for values, value in zip(data, row):
+                    values.append(value)
+            used += size
+            returned += 1
+        if truncated and total >= MAX_COUNTED_ROWS:
+            break
+
+    total_rows = f'{total}+' if truncated and total >= MAX_COUNTED_ROWS else total
+    if result_format == 'json':
+        return json.dumps({'rows_returned': returned, 'total_rows': total_rows, 'truncated': truncated,
+                           'columns': columns, 'data': dict(zip(columns, data))}, default=str)
+    header = f'rows_returned={returned} total_rows={total_rows} truncated={str(truncated).lower()}\n'
+    return header + ''.join(lines)
+
+
+def run_with_time_budget(conn, operation, timeout_ms=QUERY_TIMEOUT_MS):
+    """Run operation() and abort the SQLite statement once timeout_ms of wall-clock time has passed."""
+    deadline = time.monotonic() + timeout_ms / 1000
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_HANDLER_OPS)
+    try:
+        return operation()
+    except sqlite3.OperationalError:
+        if time.monotonic() > deadline:
+            raise QueryTooExpensive('execution time budget exceeded', timeout_ms=timeout_ms)
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def lambda_handler(event, context):
+    agent = event['agent']
+    actionGroup = event['actionGroup']
+    function = event['function']
+    parameters = event.get('parameters', [])
+    body_text=''
+    cache_status = None
+    student_scope = event.get('sessionAttributes', {}).get(STUDENT_SCOPE_ATTRIBUTE)
+    if function == 'get_schema':
+        body_text = get_schema_description(db.get())
     elif function == 'sql_query':
         query = None
         for param in parameters:
@@ -70,33 +1096,79 @@ Table Name 'student_data':
             raise Exception("Missing mandatory parameter: query")
         # Connect to the SQLite database
         print(query)  
-        
-#         # filtering logic
-#         if not student_id:
-            
-#         if 'student_data' in query:
-#             if 'where' in query or 'WHERE' in query:
-#                 query += f' and student_id={student_id}'
-#             else
-#                 query += f' where student_id={student_id}'
-        
-        conn = sqlite3.connect('/tmp/porterville_academic.db')
-
-        # Create a cursor object
-        cursor = conn.cursor()
-
-        # Execute the query
-        try:
-            cursor.execute(query)
-            # Fetch all results
-            rows = cursor.fetchall()
-        except:
-            rows = 'query is incorrect, please check column name and re-generate'
-
-        # Close the connection
-        conn.close()
+
+        # Reuse the warm connection kept alive by the connection manager
+        conn = db.get()
+        template = match_template(query)
+        if template is not None:
+            rows, cache_status = run_template(conn, *template, student_scope=student_scope)
+        elif student_scope:
+            # Student-facing agents only see the signed-in student's rows
+            rows, cache_status = run_scoped_sql_query(student_scope, query)
+        else:
+            rows, cache_status = run_sql_query(conn, query)
     
         body_text=str(rows) 
+    elif function in QUERY_TEMPLATES:
+        values = {param["name"]: param["value"] for param in parameters}
+        for name in _NAMED_PARAMETER.findall(QUERY_TEMPLATES[function]['sql']):
+            if not values.get(name):
+                raise Exception(f"Missing mandatory parameter: {name}")
+        values = {name: values[name] for name in _NAMED_PARAMETER.findall(QUERY_TEMPLATES[function]['sql'])}
+        print(function, values)
+
+        body_text, cache_status = run_template(db.get(), function, values, student_scope=student_scope)
+    elif function == 'get_student_summary':
+        student_id = None
+        for param in parameters:
+            if param["name"] == "student_id":
+                student_id = param["value"]
+
+        # In a student-scoped session only the signed-in student's summary is returned
+        student_id = student_scope or student_id
+        if not student_id:
+            raise Exception("Missing mandatory parameter: student_id")
+        print(function, student_id)
+
+        body_text, cache_status = get_student_summary(db.get(), student_id)
+    elif function == 'get_conflict_free_sections':
+        values = {param["name"]: param["value"] for param in parameters}
+        # In a student-scoped session only the signed-in student's schedule is used
+        if student_scope:
+            values['student_id'] = student_scope
+        for name in ('student_id', 'term'):
+            if not values.get(name):
+                raise Exception(f"Missing mandatory parameter: {name}")
+        print(function, values)
+
+        body_text, cache_status = get_conflict_free_sections(db.get(), values['student_id'], values['term'])
+    elif function == 'eligible_courses':
+        values = {param["name"]: param["value"] for param in parameters}
+        # In a student-scoped session only the signed-in student's history is used
+        if student_scope:
+            values['student_id'] = student_scope
+        for name in ('student_id', 'term'):
+            if not values.get(name):
+                raise Exception(f"Missing mandatory parameter: {name}")
+        print(function, values)
+
+        body_text, cache_status = eligible_courses(db.get(), values['student_id'], values['term'])
+    elif function == 'sql_query_batch':
+        queries = None
+        parallel = False
+        for param in parameters:
+            if param["name"] == "queries":
+                queries = param["value"]
+            if param["name"] == "parallel":
+                parallel = str(param["value"]).lower() == 'true'
+
+        if not queries:
+            raise Exception("Missing mandatory parameter: queries")
+        print(queries)
+
+        results = run_sql_query_batch(parse_batch_queries(queries), parallel, student_scope)
+        body_text = '\n'.join(f'=== {label} ===\n{body}' for label, body, _ in results)
+        cache_status = ','.join(status or 'rejected' for _, _, status in results)
     else:
         pass
 
@@ -117,6 +1189,15 @@ Table Name 'student_data':
     }
 
     function_response = {'response': action_response, 'messageVersion': event['messageVersion']}
+    if cache_status is not None:
+        # Session attributes must be strings; keep the caller's attributes intact.
+        stats = query_cache.stats()
+        function_response['sessionAttributes'] = {
+            **event.get('sessionAttributes', {}),
+            'sql_cache_status': cache_status,
+            'sql_cache_hits': str(stats['hits']),
+            'sql_cache_misses': str(stats['misses']),
+        }
     print("Response: {}".format(function_response))
 
     return function_response
@@ -0,0 +1,475 @@
+"""
+Helpers for building and maintaining the SQLite academic database
+(porterville_academic.db) queried by the course recommendation agents.
+"""
+
+import csv
+import itertools
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import time
+
+# Typed DDL for the academic tables. Student IDs keep their zero padding as TEXT,
+# terms are INTEGER (e.g. 202408) and class times are INTEGER HHMM (e.g. 900 for 9:00am).
+ACADEMIC_TABLES = {
+    'student_data': [
+        ('student_id', 'TEXT'), ('term', 'INTEGER'), ('course_code', 'TEXT'),
+        ('credits', 'REAL'), ('grade', 'TEXT'), ('major', 'TEXT'),
+    ],
+    'student_schedule': [
+        ('student_id', 'TEXT'), ('term', 'INTEGER'), ('course_code', 'TEXT'), ('print_daytime', 'TEXT'),
+        ('building_number', 'TEXT'), ('room_number', 'TEXT'), ('class_days', 'TEXT'),
+        ('class_start_time', 'INTEGER'), ('class_end_time', 'INTEGER'),
+    ],
+    'course_schedule': [
+        ('term', 'INTEGER'), ('course_code', 'TEXT'), ('print_daytime', 'TEXT'),
+        ('building_number', 'TEXT'), ('room_number', 'TEXT'), ('class_days', 'TEXT'),
+        ('class_start_time', 'INTEGER'), ('class_end_time', 'INTEGER'),
+    ],
+}
+STUDENT_ID_WIDTH = 3
+
+# Natural keys used to upsert rows during incremental, per-term ingestion. A course
+# can have several sections at the same time in different rooms, so the room is
+# part of a section's key.
+NATURAL_KEYS = {
+    'student_data': ['student_id', 'term', 'course_code'],
+    'student_schedule': ['student_id', 'term', 'course_code'],
+    'course_schedule': ['term', 'course_code', 'class_days', 'class_start_time', 'building_number', 'room_number'],
+}
+# Key columns that are NULL for online/TBA sections. A unique index never treats
+# NULLs as equal, so these are indexed as ifnull(column, '') for upserts to match.
+NULLABLE_KEY_COLUMNS = {'class_days', 'class_start_time', 'building_number', 'room_number'}
+
+# Covering indexes for the lookups the agents issue most: a student's history or
+# schedule by term, results and offerings of a course by term, and offerings by
+# term and meeting days.
+ACADEMIC_INDEXES = {
+    'idx_student_data_student_term': ('student_data', ['student_id', 'term', 'course_code', 'grade', 'credits']),
+    'idx_student_data_course_term': ('student_data', ['course_code', 'term', 'grade']),
+    'idx_student_schedule_student_term': ('student_schedule', ['student_id', 'term', 'course_code']),
+    'idx_course_schedule_course_term': ('course_schedule', ['course_code', 'term']),
+    'idx_course_schedule_term_days': ('course_schedule', ['term', 'class_days', 'class_start_time', 'class_end_time', 'course_code']),
+}
+
+# Grade points for GPA; W and ungraded rows count towards neither GPA nor credits.
+GRADE_POINTS = {'A': 4.0, 'A-': 3.7, 'B+': 3.3, 'B': 3.0, 'B-': 2.7, 'C+': 2.3, 'C': 2.0, 'D': 1.0, 'F': 0.0}
+PASSING_GRADES = {'A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D'}
+
+# One precomputed row per student so agents get GPA, credits, passed courses and
+# major without scanning student_data. passed_courses is a little-endian bitmap
+# over the bit numbers assigned in student_summary_course; bits are only ever
+# appended, so existing bitmaps stay valid when new courses appear.
+STUDENT_SUMMARY_DDL = (
+    'CREATE TABLE IF NOT EXISTS student_summary (student_id TEXT PRIMARY KEY, latest_term INTEGER, '
+    'latest_major TEXT, terms_enrolled INTEGER, attempted_credits REAL, earned_credits REAL, '
+    'cumulative_gpa REAL, gpa_by_term TEXT, passed_course_count INTEGER, passed_courses BLOB, updated_at TEXT)',
+    'CREATE TABLE IF NOT EXISTS student_summary_course (course_code TEXT PRIMARY KEY, bit INTEGER NOT NULL UNIQUE)',
+)
+
+# Only statements of exactly this shape are accepted from index advisor logs.
+_ADVISOR_DDL = re.compile(r'CREATE INDEX IF NOT EXISTS \w+ ON \w+ \(\w+(?:, \w+)*\)')
+
+
+def create_academic_indexes(db_name, indexes=ACADEMIC_INDEXES, analyze=True):
+    """
+    Create the covering indexes for the academic tables and refresh planner statistics.
+
+    :param db_name: path of the SQLite database
+    :param indexes: mapping of index name to (table name, indexed columns)
+    :param analyze: run ANALYZE afterwards so the query planner sees the new indexes' selectivity
+    """
+    conn = sqlite3.connect(db_name)
+    try:
+        with conn:
+            for index_name, (table_name, columns) in indexes.items():
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({", ".join(columns)})')
+        if analyze:
+            conn.execute('ANALYZE')
+    finally:
+        conn.close()
+
+
+def build_recommended_indexes(db_name, advisor_log, analyze=True):
+    """
+    Build the indexes recommended by the text2sql Lambda's index advisor.
+
+    :param db_name: path of the SQLite database
+    :param advisor_log: CloudWatch log text (or an iterable of log lines) containing 'INDEX ADVISOR' records
+    :param analyze: run ANALYZE afterwards
+    :return: the CREATE INDEX statements that were executed
+    """
+    if not isinstance(advisor_log, str):
+        advisor_log = '\n'.join(advisor_log)
+    statements = sorted(set(_ADVISOR_DDL.findall(advisor_log)))
+    conn = sqlite3.connect(db_name)
+    try:
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+        if statements and analyze:
+            conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return statements
+
+
+def _converter(column, column_type, student_id_width):
+    if column == 'student_id':
+        return lambda value: value.strip().zfill(student_id_width) if value.strip() else None
+    if column_type == 'INTEGER':
+        return lambda value: int(value) if value.strip() else None
+    if column_type == 'REAL':
+        return lambda value: float(value) if value.strip() else None
+    return lambda value: value if value != '' else None
+
+
+def read_csv_rows(csv_file_path, table_name, student_id_width=STUDENT_ID_WIDTH):
+    """
+    Lazily read a CSV export as typed tuples in ACADEMIC_TABLES column order.
+
+    :raises ValueError: if the CSV header is missing a column of the table
+    """
+    columns = ACADEMIC_TABLES[table_name]
+    with open(csv_file_path, newline='') as file:
+        reader = csv.reader(file)
+        header = [name.strip() for name in next(reader)]
+        missing = [column for column, _ in columns if column not in header]
+        if missing:
+            raise ValueError(f"{csv_file_path} is missing columns for table {table_name}: {missing}")
+        positions = [header.index(column) for column, _ in columns]
+        converters = [_converter(column, column_type, student_id_width) for column, column_type in columns]
+        for record in reader:
+            if record:
+                yield tuple(convert(record[position]) for convert, position in zip(converters, positions))
+
+
+def create_typed_table(conn, table_name):
+    columns = ', '.join(f'{column} {column_type}' for column, column_type in ACADEMIC_TABLES[table_name])
+    conn.execute(f'DROP TABLE IF EXISTS {table_name}')
+    conn.execute(f'CREATE TABLE {table_name} ({columns})')
+
+
+def load_csv_streaming(conn, csv_file_path, table_name, batch_size=50000):
+    """Insert a CSV export into table_name in executemany batches; returns the number of rows loaded."""
+    placeholders = ', '.join('?' for _ in ACADEMIC_TABLES[table_name])
+    insert = f'INSERT INTO {table_name} VALUES ({placeholders})'
+    rows = read_csv_rows(csv_file_path, table_name)
+    loaded = 0
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return loaded
+        conn.executemany(insert, batch)
+        loaded += len(batch)
+
+
+def _copy_other_objects(conn, source_db_name, table_names):
+    """
+    Copy every table of source_db_name that is not in table_names, with its rows,
+    into conn, then the indexes, views and triggers that belong to those tables.
+    Must run outside a transaction (ATTACH is not allowed inside one).
+    """
+    conn.execute('ATTACH DATABASE ? AS source', (source_db_name,))
+    try:
+        placeholders = ', '.join('?' for _ in table_names)
+        objects = conn.execute(
+            "SELECT type, name, sql FROM source.sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            f"AND tbl_name NOT IN ({placeholders}) "
+            "ORDER BY CASE type WHEN 'table' THEN 0 WHEN 'index' THEN 1 WHEN 'view' THEN 2 ELSE 3 END",
+            list(table_names),
+        ).fetchall()
+        with conn:
+            for object_type, name, sql in objects:
+                conn.execute(sql)
+                if object_type == 'table':
+                    conn.execute(f'INSERT INTO main."{name}" SELECT * FROM source."{name}"')
+    finally:
+        conn.execute('DETACH DATABASE source')
+    return [name for object_type, name, _ in objects if object_type == 'table']
+
+
+def create_db_tables_from_csv_files(csv_file_paths, db_name, table_names, batch_size=50000, indexes=ACADEMIC_INDEXES):
+    """
+    Rebuild the academic tables from CSV exports without holding a file in memory.
+    Use ingest_term() instead when only one term's data has changed.
+
+    The database is built in a new file next to db_name and moved over it with
+    os.replace() once complete, so a crash mid-load leaves db_name untouched and
+    the result carries no free pages from the dropped tables. Other tables of an
+    existing db_name (catalog, prerequisites, data version) are copied across.
+    Rows are loaded in a single transaction with journaling and syncs turned off,
+    which is safe because nothing reads the new file until it is moved into place;
+    indexes are built afterwards so rows are not indexed one at a time.
+
+    :return: per-table report of rows loaded, seconds taken and rows/sec
+    """
+    # Ensure the list of CSV file paths and table names are of the same length
+    if len(csv_file_paths) != len(table_names):
+        raise ValueError("The number of CSV files must match the number of table names.")
+
+    directory, file_name = os.path.split(os.path.abspath(db_name))
+    handle, build_name = tempfile.mkstemp(prefix=f'.{file_name}.', suffix='.build', dir=directory)
+    os.close(handle)
+    try:
+        report = _build_db_from_csv_files(csv_file_paths, build_name, table_names, batch_size, indexes,
+                                          db_name if os.path.exists(db_name) else None)
+        os.replace(build_name, db_name)
+    except BaseException:
+        os.remove(build_name)
+        raise
+    return report
+
+
+def _build_db_from_csv_files(csv_file_paths, db_name, table_names, batch_size, indexes, source_db_name):
+    report = {}
+    conn = sqlite3.connect(db_name, isolation_level=None)
+    try:
+        for table_name in table_names:
+            create_typed_table(conn, table_name)
+        if source_db_name is not None:
+            copied = _copy_other_objects(conn, source_db_name, table_names)
+            print(f"copied {len(copied)} tables from {source_db_name}: {', '.join(copied)}")
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('BEGIN')
+        for csv_file_path, table_name in zip(csv_file_paths, table_names):
+            start = time.perf_counter()
+            loaded = load_csv_streaming(conn, csv_file_path, table_name, batch_size)
+            elapsed = time.perf_counter() - start
+            report[table_name] = {'rows': loaded, 'seconds': elapsed, 'rows_per_sec': loaded / elapsed if elapsed else 0.0}
+        conn.execute('COMMIT')
+        conn.execute('PRAGMA journal_mode = DELETE')
+        with conn:
+            ensure_ingest_metadata(conn, table_names)
+            for table_name in table_names:
+                _record_watermark(conn, table_name, report[table_name]['rows'])
+            bump_data_version(conn)
+    finally:
+        conn.close()
+
+    start = time.perf_counter()
+    create_academic_indexes(db_name, {name: spec for name, spec in indexes.items() if spec[0] in table_names})
+    index_seconds = time.perf_counter() - start
+
+    for table_name, stats in report.items():
+        print(f"{table_name}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:,.0f} rows/sec)")
+    print(f"indexes built in {index_seconds:.2f}s")
+
+    if 'student_data' in table_names:
+        start = time.perf_counter()
+        conn = sqlite3.connect(db_name)
+        try:
+            with conn:
+                summarized = refresh_student_summary(conn)
+        finally:
+            conn.close()
+        print(f"student_summary: {summarized} students in {time.perf_counter() - start:.2f}s")
+    return report
+
+
+def natural_key_terms(table_name):
+    """The natural key of table_name as indexed: nullable columns wrapped in ifnull(column, '')."""
+    return [f"ifnull({column}, '')" if column in NULLABLE_KEY_COLUMNS else column
+            for column in NATURAL_KEYS[table_name]]
+
+
+def _ensure_natural_key_index(conn, table_name):
+    """
+    Create the unique natural key index of table_name, replacing an index built for
+    an older key. Rows that repeat a key are collapsed first, keeping the last row
+    loaded, which is what ingest_term() would have kept.
+    """
+    name = f'uq_{table_name}_natural_key'
+    terms = ', '.join(natural_key_terms(table_name))
+    ddl = f'CREATE UNIQUE INDEX {name} ON {table_name} ({terms})'
+    existing = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()
+    if existing and existing[0] == ddl:
+        return
+    if existing:
+        conn.execute(f'DROP INDEX {name}')
+    removed = conn.execute(
+        f'DELETE FROM {table_name} WHERE rowid NOT IN (SELECT max(rowid) FROM {table_name} GROUP BY {terms})'
+    ).rowcount
+    if removed:
+        print(f"{table_name}: removed {removed} rows repeating a natural key")
+    conn.execute(ddl)
+
+
+def ensure_ingest_metadata(conn, table_names=tuple(NATURAL_KEYS)):
+    """Create the watermark and data version tables and the natural key indexes used for upserts."""
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS ingest_watermark '
+        '(table_name TEXT PRIMARY KEY, max_term INTEGER, rows_upserted INTEGER, updated_at TEXT)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS academic_data_version '
+        '(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, updated_at TEXT)'
+    )
+    conn.execute("INSERT OR IGNORE INTO academic_data_version VALUES (1, 0, datetime('now'))")
+    for table_name in table_names:
+        _ensure_natural_key_index(conn, table_name)
+
+
+def bump_data_version(conn):
+    """Increment the data version that downstream caches (e.g. the text2sql Lambda) use for invalidation."""
+    conn.execute("UPDATE academic_data_version SET version = version + 1, updated_at = datetime('now') WHERE id = 1")
+    return conn.execute('SELECT version FROM academic_data_version').fetchone()[0]
+
+
+def _record_watermark(conn, table_name, rows_upserted):
+    conn.execute(
+        "INSERT INTO ingest_watermark VALUES (?, (SELECT max(term) FROM " + table_name + "), ?, datetime('now')) "
+        "ON CONFLICT (table_name) DO UPDATE SET max_term = excluded.max_term, "
+        "rows_upserted = excluded.rows_upserted, updated_at = excluded.updated_at",
+        (table_name, rows_upserted),
+    )
+
+
+def ingest_term(db_name, csv_file_path, table_name, term, batch_size=50000):
+    """
+    Incrementally ingest one term of a CSV export into an existing academic database.
+
+    Rows of other terms in the file are skipped. Rows are upserted on the table's
+    natural key and an existing row is only rewritten when one of its values changed.
+    The table's watermark is updated and, if anything changed, the data version is
+    bumped and the student_summary rows of the students in the term are refreshed.
+
+    :return: number of rows inserted or updated
+    """
+    term = int(term)
+    columns = [column for column, _ in ACADEMIC_TABLES[table_name]]
+    key = NATURAL_KEYS[table_name]
+    values = [column for column in columns if column not in key]
+    term_position = columns.index('term')
+    upsert = (
+        f'INSERT INTO {table_name} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)}) '
+        f'ON CONFLICT ({", ".join(natural_key_terms(table_name))}) DO UPDATE SET '
+        + ', '.join(f'{column} = excluded.{column}' for column in values)
+        + ' WHERE ' + ' OR '.join(f'{table_name}.{column} IS NOT excluded.{column}' for column in values)
+    )
+
+    conn = sqlite3.connect(db_name)
+    try:
+        with conn:
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+            if not exists:
+                create_typed_table(conn, table_name)
+            ensure_ingest_metadata(conn, [table_name])
+            before = conn.total_changes
+            rows = (row for row in read_csv_rows(csv_file_path, table_name) if row[term_position] == term)
+            student_ids = set()
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+                conn.executemany(upsert, batch)
+                if table_name == 'student_data':
+                    student_ids.update(row[0] for row in batch)
+            upserted = conn.total_changes - before
+            _record_watermark(conn, table_name, upserted)
+            if upserted and student_ids:
+                refresh_student_summary(conn, student_ids)
+            version = bump_data_version(conn) if upserted else None
+    finally:
+        conn.close()
+    print(f"{table_name} term {term}: {upserted} rows upserted" + (f", data version {version}" if version else ''))
+    return upserted
+
+
+def summarize_student(rows):
+    """
+    Summarize one student's history.
+
+    :param rows: (term, course_code, credits, grade, major) tuples ordered by term
+    :return: dict of summary values with passed_courses as a set of course codes
+    """
+    points_by_term, credits_by_term = {}, {}
+    attempted = 0.0
+    passed = {}
+    latest_term = latest_major = None
+    for term, course_code, credits, grade, major in rows:
+        latest_term, latest_major = term, major or latest_major
+        credits = credits or 0.0
+        if grade in GRADE_POINTS:
+            attempted += credits
+            points_by_term[term] = points_by_term.get(term, 0.0) + GRADE_POINTS[grade] * credits
+            credits_by_term[term] = credits_by_term.get(term, 0.0) + credits
+        if grade in PASSING_GRADES:
+            # A retaken course only counts once
+            passed[course_code] = max(passed.get(course_code, 0.0), credits)
+    gpa_by_term = {str(term): round(points_by_term[term] / credits_by_term[term], 3)
+                   for term in credits_by_term if credits_by_term[term]}
+    graded = sum(credits_by_term.values())
+    return {
+        'latest_term': latest_term,
+        'latest_major': latest_major,
+        'terms_enrolled': len({row[0] for row in rows}),
+        'attempted_credits': attempted,
+        'earned_credits': sum(passed.values()),
+        'cumulative_gpa': round(sum(points_by_term.values()) / graded, 3) if graded else None,
+        'gpa_by_term': gpa_by_term,
+        'passed_courses': set(passed),
+    }
+
+
+def _course_bits(conn, course_codes):
+    """Return course_code -> bit, appending bits for course codes seen for the first time."""
+    bits = dict(conn.execute('SELECT course_code, bit FROM student_summary_course'))
+    next_bit = max(bits.values(), default=-1) + 1
+    new_codes = sorted(set(course_codes) - set(bits))
+    conn.executemany('INSERT INTO student_summary_course VALUES (?, ?)',
+                     [(code, next_bit + offset) for offset, code in enumerate(new_codes)])
+    bits.update((code, next_bit + offset) for offset, code in enumerate(new_codes))
+    return bits
+
+
+def encode_course_bitmap(course_codes, bits):
+    value = 0
+    for code in course_codes:
+        value |= 1 << bits[code]
+    return value.to_bytes((value.bit_length() + 7) // 8, 'little')
+
+
+def refresh_student_summary(conn, student_ids=None, batch_size=5000):
+    """
+    Rebuild student_summary from student_data, for every student or only for student_ids.
+    Runs inside the caller's transaction.
+
+    :return: number of students summarized
+    """
+    for statement in STUDENT_SUMMARY_DDL:
+        conn.execute(statement)
+    bits = _course_bits(conn, [code for (code,) in conn.execute('SELECT DISTINCT course_code FROM student_data')])
+    select = 'SELECT student_id, term, course_code, credits, grade, major FROM student_data'
+    if student_ids is None:
+        conn.execute('DELETE FROM student_summary')
+        cursor = conn.execute(select + ' ORDER BY student_id, term')
+    else:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS summary_refresh (student_id TEXT PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.summary_refresh')
+        conn.executemany('INSERT OR IGNORE INTO temp.summary_refresh VALUES (?)', ((sid,) for sid in student_ids))
+        conn.execute('DELETE FROM student_summary WHERE student_id IN (SELECT student_id FROM temp.summary_refresh)')
+        cursor = conn.execute(select + ' WHERE student_id IN (SELECT student_id FROM temp.summary_refresh)'
+                                       ' ORDER BY student_id, term')
+
+    insert = f"INSERT INTO student_summary VALUES ({', '.join('?' for _ in range(10))}, datetime('now'))"
+    summarized = 0
+    batch = []
+    for student_id, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+        summary = summarize_student([row[1:] for row in rows])
+        batch.append((
+            student_id, summary['latest_term'], summary['latest_major'], summary['terms_enrolled'],
+            summary['attempted_credits'], summary['earned_credits'], summary['cumulative_gpa'],
+            json.dumps(summary['gpa_by_term']), len(summary['passed_courses']),
+            encode_course_bitmap(summary['passed_courses'], bits),
+        ))
+        if len(batch) >= batch_size:
+            conn.executemany(insert, batch)
+            summarized += len(batch)
+            batch = []
+    conn.executemany(insert, batch)
+    return summarized + len(batch)
@@ -0,0 +1,294 @@
+"""
+Extract the course prerequisite graph from the college catalog (2024-2025_Catalog.pdf)
+into the academic database, so eligibility can be checked with a graph lookup instead
+of a knowledge base retrieval and LLM reasoning over the catalog text.
+
+Usage (from the repository root):
+    python -m utils.course_catalog --catalog 2024-2025_Catalog.pdf --db porterville_academic.db
+"""
+
+import argparse
+import itertools
+import re
+import sqlite3
+import time
+
+from utils.academic_db import bump_data_version, ensure_ingest_metadata
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # only needed to read the PDF; parse_catalog() works on extracted text
+    PdfReader = None
+
+# course_catalog keeps one row per catalog course with the prerequisite as printed.
+# course_prerequisite is the adjacency list of the prerequisite graph in conjunctive
+# form: a course requires every group_no, and a group is met by any one of its
+# required_course rows. concurrent = 1 marks a requirement that may also be taken
+# in the same term (co-requisites and "concurrent enrollment in ..."). non_course = 1
+# marks a group that can also be met without any of its courses ("or equivalent",
+# "or higher", "or appropriate placement"), which only the printed text describes.
+CATALOG_DDL = (
+    'CREATE TABLE IF NOT EXISTS course_catalog (course_code TEXT PRIMARY KEY, subject TEXT, title TEXT, '
+    'units TEXT, prerequisite TEXT) WITHOUT ROWID',
+    'CREATE TABLE IF NOT EXISTS course_prerequisite (course_code TEXT, group_no INTEGER, required_course TEXT, '
+    'concurrent INTEGER NOT NULL DEFAULT 0, non_course INTEGER NOT NULL DEFAULT 0, '
+    'PRIMARY KEY (course_code, group_no, required_course)) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS idx_course_prerequisite_required ON course_prerequisite (required_course)',
+)
+
+_PREFIX_LISTING = re.compile(r'^Course Prefix Listing$(.*?)^COURSE DESCRIPTIONS$', re.M | re.S)
+_PREFIX_LINE = re.compile(r'^(.+?)\s*\.{3,}\s*([A-Z][A-Z0-9]{1,4})\s*$', re.M)
+_COURSE_LINE = re.compile(r'^(P\d{2,3}[A-Z]{0,2})\s*[–-]\s*(.*)$')
+_UNITS = re.compile(r'\.{2,}\s*([\d.]+(?:\s*-\s*[\d.]+)?)\s*UNITS?\b')
+_PAGE_FURNITURE = re.compile(r'^(?:\d+|COURSE DESCRIPTIONS)$')
+_PREREQUISITE = re.compile(
+    r'Prerequisites?:\s*(.*?)\s*(?=\b(?:Grading|Recommend\w*|Co-?requisites?|Advisor(?:y|ies)|Limitations?):'
+    r'|\bTotal\s+(?:lecture|laboratory)|$)', re.S)
+# Subject headings of the course descriptions that are worded differently in the prefix listing
+_HEADING_PREFIXES = {'industrialtechnology': 'INDT', 'vocationalenglishasa2ndlanguage': 'VESL'}
+# "with a C or better" and "or equivalent" read like alternatives but qualify the course before them
+_GRADE_QUALIFIER = re.compile(
+    r'(?:with\s+)?(?:a\s+)?(?:grade\s+of\s+)?[“”"‘’\']?\s*[A-F][+-]?\s*[“”"‘’\']?\s+or\s+(?:better|higher)', re.I)
+_EQUIVALENT_QUALIFIER = re.compile(r'\bor\s+(?:the\s+)?(?:equivalent|higher)\b', re.I)
+_EXCLUSION = re.compile(r'\b(?:excluding|except)\b', re.I)
+_CONCURRENT = re.compile(r'concurrent|co-?requisite', re.I)
+# A placement level ("eligible for ENGL P101A") rather than a completed course
+_PLACEMENT = re.compile(r'eligible\s+for\s*$', re.I)
+# An alternative that is not a course: "or equivalent", "or higher", "or appropriate
+# math placement", "or demonstrated skill level", "or equivalent proficiency"
+_NON_COURSE_ALTERNATIVE = re.compile(
+    r'\bor\b[^,;.]*?\b(?:equivalent|higher|placement|proficiency|skill)\b', re.I)
+# Stands for a non-course alternative while the groups are distributed
+_NON_COURSE = ('', False)
+# A word hyphenated at a PDF line break ("place- ment") once the lines are joined
+_LINE_BREAK_HYPHEN = re.compile(r'(\w)- (\w)')
+
+# Printed prerequisites of the 2024-2025 catalog that are easy to misparse, with the
+# groups they must produce; build_prerequisite_graph() checks each course it finds.
+KNOWN_PREREQUISITES = {
+    # "..., or appropriate math place- ment as determined by ...": hyphenated at a line break
+    'MATH P103': [([('MATH P101', False), ('MATH P101A', False)], True)],
+    # "MATH P051 or higher"
+    'CHEM P105': [([('MATH P051', False)], True)],
+    # "EL2 P071B or placement through a multiple- measure process, ..."
+    'EL2 P060': [([('EL2 P071B', False)], True)],
+}
+
+
+def extract_catalog_text(pdf_file):
+    """Extract the catalog text page by page with pypdf."""
+    if PdfReader is None:
+        raise ImportError('pypdf is required to read the catalog PDF: pip install pypdf')
+    return '\n'.join(page.extract_text() or '' for page in PdfReader(pdf_file).pages)
+
+
+def _squash(name):
+    # PDF extraction splits some words ("V ocational"), so names are compared without spaces
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def subject_prefixes(text):
+    """
+    Map every subject name and prefix of the catalog's Course Prefix Listing, squashed
+    to lower-case letters and digits, to the prefix (e.g. 'mathematics' and 'math' -> 'MATH').
+    """
+    listing = _PREFIX_LISTING.search(text)
+    if listing is None:
+        raise ValueError('the catalog text has no Course Prefix Listing')
+    prefixes = {}
+    for name, prefix in _PREFIX_LINE.findall(listing.group(1)):
+        prefixes[_squash(name)] = prefix
+        prefixes[_squash(prefix)] = prefix
+    return prefixes
+
+
+def _reference_pattern(text):
+    """Regex for course references ("Math P103", "CHEM 105", "Computer Graphics P110", bare "P100")."""
+    names = {prefix for name, prefix in _PREFIX_LINE.findall(_PREFIX_LISTING.search(text).group(1))}
+    names.update(name.strip() for name, _ in _PREFIX_LINE.findall(_PREFIX_LISTING.search(text).group(1)))
+    subject = '|'.join(r'\s+'.join(map(re.escape, name.split())) for name in sorted(names, key=len, reverse=True))
+    return re.compile(
+        rf'\b(?:(?P<subject>{subject})\s+(?P<prefix>PO|P)?|(?P<bare>PO|P))(?P<number>\d{{2,3}}[A-Z]{{0,2}})\b', re.I)
+
+
+def _course_code(match, prefixes, subject):
+    if match.group('subject'):
+        subject = prefixes.get(_squash(match.group('subject')))
+    number = match.group('number').upper()
+    if (match.group('prefix') or match.group('bare') or '').upper() == 'PO':
+        number = '0' + number  # "PO71A" is an OCR-style typo of "P071A"
+    return f'{subject} P{number}'
+
+
+def parse_prerequisites(prerequisite, course_code, subject, prefixes, pattern):
+    """
+    Turn a printed prerequisite into requirement groups (conjunctive normal form).
+
+    Course references are joined by the connective between them: "or" (or "/") keeps
+    them in one alternative, "and" starts the next one, and a comma takes the next
+    connective in the sentence ("A, B, and C" versus "A, B or equivalent"). The
+    resulting disjunction of alternatives is distributed into groups, so "A and B or
+    C and D" becomes (A|C)(A|D)(B|C)(B|D). An alternative that is not a course ("or
+    equivalent", "or higher", "or appropriate placement", "or eligible for ...")
+    joins the disjunction as a whole, so "A and B, or equivalent" flags both groups
+    as non_course. Other non-course conditions (program standing) stay in the
+    printed text only.
+
+    :return: list of (group, non_course) tuples, group a sorted list of
+             (required_course, concurrent) tuples
+    """
+    text = _LINE_BREAK_HYPHEN.sub(r'\1\2', prerequisite)
+    text = _GRADE_QUALIFIER.sub(' ', _EXCLUSION.split(text)[0])
+    alternatives, previous_end, non_course = [], 0, False
+    for match in pattern.finditer(text):
+        code = _course_code(match, prefixes, subject)
+        before = text[previous_end:match.start()]
+        non_course = non_course or bool(_NON_COURSE_ALTERNATIVE.search(before))
+        if _PLACEMENT.search(before):
+            non_course = non_course or bool(re.search(r'\bor\b', before, re.I))
+        elif code != course_code:
+            requirement = (code, bool(_CONCURRENT.search(before)))
+            if alternatives and _connective(before, text[previous_end:]) == 'and':
+                alternatives[-1].append(requirement)
+            else:
+                alternatives.append([requirement])
+        previous_end = match.end()
+    non_course = non_course or bool(_NON_COURSE_ALTERNATIVE.search(text[previous_end:]))
+
+    if not alternatives:
+        return []
+    if non_course:
+        alternatives.append([_NON_COURSE])
+    groups = []
+    for combination in itertools.product(*alternatives):
+        group = {}
+        for code, concurrent in combination:
+            group[code] = group.get(code, True) and concurrent
+        group = frozenset(group.items())
+        if group not in groups:
+            groups.append(group)
+    # Absorption: a group that contains another group is implied by it
+    groups = [group for group in groups if not any(other < group for other in groups)]
+    return [(sorted(group - {_NON_COURSE}), _NON_COURSE in group) for group in groups if group != {_NON_COURSE}]
+
+
+def _connective(between, rest):
+    """'and' or 'or' for the text between two course references; rest runs to the end of the sentence."""
+    between = _EQUIVALENT_QUALIFIER.sub(' ', between)
+    if re.search(r'\bor\b|/', between, re.I):
+        return 'or'
+    if re.search(r'\band\b|&', between, re.I):
+        return 'and'
+    if re.search(r'[,;]', between):
+        following = re.search(r'\b(and|or)\b', rest, re.I)
+        return following.group(1).lower() if following else 'and'
+    return 'or'
+
+
+def parse_catalog(text):
+    """
+    Parse the COURSE DESCRIPTIONS section of the catalog text.
+
+    :return: list of dicts with course_code, subject, title, units, prerequisite and
+             groups (see parse_prerequisites())
+    """
+    prefixes = subject_prefixes(text)
+    pattern = _reference_pattern(text)
+    lines = [line.strip() for line in text[_PREFIX_LISTING.search(text).end():].splitlines()]
+    lines = [line for line in lines if line and not _PAGE_FURNITURE.match(line)]
+
+    headings = {**prefixes, **_HEADING_PREFIXES}
+    entries, subject, previous = [], None, ''
+    for line in lines:
+        course = _COURSE_LINE.match(line)
+        # Subject headings are upper case without leader dots, some wrapped over two lines
+        heading = line.isupper() and not course and '.' not in line
+        if heading and (_squash(line) in headings or _squash(previous + line) in headings):
+            subject = headings.get(_squash(line)) or headings[_squash(previous + line)]
+        elif course and subject:
+            entries.append([subject, course.group(1), [course.group(2)]])
+        elif entries:
+            entries[-1][2].append(line)
+        previous = line if heading else ''
+
+    courses = {}
+    for subject, number, body in entries:
+        header = ' '.join(itertools.takewhile(lambda line: not line.startswith('Prerequisite'), body[:3]))
+        units = _UNITS.search(header)
+        title = ' '.join(re.split(r'\s*\.{2,}', header)[0].split())
+        prerequisite = _PREREQUISITE.search(' '.join(body))
+        prerequisite = ' '.join(prerequisite.group(1).split()) if prerequisite else None
+        if prerequisite and re.match(r'none\b', prerequisite, re.I):
+            prerequisite = None
+        course_code = f'{subject} {number}'
+        courses[course_code] = {
+            'course_code': course_code, 'subject': subject, 'title': title,
+            'units': re.sub(r'\s+', '', units.group(1)) if units else None, 'prerequisite': prerequisite,
+            'groups': parse_prerequisites(prerequisite, course_code, subject, prefixes, pattern)
+            if prerequisite else [],
+        }
+    return list(courses.values())
+
+
+def store_prerequisite_graph(db_name, courses):
+    """Replace course_catalog and course_prerequisite with the parsed courses and bump the data version."""
+    conn = sqlite3.connect(db_name)
+    try:
+        with conn:
+            # Rebuilt from scratch, so a table from an older layout is simply replaced
+            conn.execute('DROP TABLE IF EXISTS course_prerequisite')
+            for statement in CATALOG_DDL:
+                conn.execute(statement)
+            conn.execute('DELETE FROM course_catalog')
+            conn.executemany('INSERT INTO course_catalog VALUES (?, ?, ?, ?, ?)', [
+                (course['course_code'], course['subject'], course['title'], course['units'], course['prerequisite'])
+                for course in courses
+            ])
+            conn.executemany('INSERT INTO course_prerequisite VALUES (?, ?, ?, ?, ?)', [
+                (course['course_code'], group_no, required_course, int(concurrent), int(non_course))
+                for course in courses
+                for group_no, (group, non_course) in enumerate(course['groups'])
+                for required_course, concurrent in group
+            ])
+            ensure_ingest_metadata(conn, ())
+            version = bump_data_version(conn)
+    finally:
+        conn.close()
+    return version
+
+
+def check_known_prerequisites(courses, known=KNOWN_PREREQUISITES):
+    """
+    Compare the parsed groups of the courses in known with the groups expected for them.
+
+    :raises ValueError: listing every course whose groups differ
+    """
+    parsed = {course['course_code']: course['groups'] for course in courses}
+    mismatched = [f"{code}: expected {groups}, parsed {parsed[code]}"
+                  for code, groups in known.items() if code in parsed and parsed[code] != groups]
+    if mismatched:
+        raise ValueError('prerequisites parsed differently than expected:\n' + '\n'.join(mismatched))
+
+
+def build_prerequisite_graph(pdf_file, db_name):
+    """Extract the catalog PDF, check the known prerequisites and store the prerequisite graph in db_name."""
+    start = time.perf_counter()
+    courses = parse_catalog(extract_catalog_text(pdf_file))
+    check_known_prerequisites(courses)
+    version = store_prerequisite_graph(db_name, courses)
+    edges = sum(len(group) for course in courses for group, _ in course['groups'])
+    print(f"course_catalog: {len(courses)} courses, {sum(bool(c['groups']) for c in courses)} with course "
+          f"prerequisites, {edges} edges in {time.perf_counter() - start:.2f}s, data version {version}")
+    return courses
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract the prerequisite graph from the course catalog PDF.')
+    parser.add_argument('--catalog', default='2024-2025_Catalog.pdf')
+    parser.add_argument('--db', default='porterville_academic.db')
+    args = parser.parse_args()
+    build_prerequisite_graph(args.catalog, args.db)
+
+
+if __name__ == '__main__':
+    main()
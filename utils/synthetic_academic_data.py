@@ -0,0 +1,191 @@
+"""
+Deterministic generator of large synthetic academic datasets shaped like the
+data/porterville_*.csv exports, for load and latency testing of the agents' tools.
+
+Usage:
+    python -m utils.synthetic_academic_data --students 50000 --years 10 --out-dir /tmp/synthetic
+"""
+
+import argparse
+import csv
+import os
+import random
+
+from utils.academic_db import create_db_tables_from_csv_files
+
+# (course prefix, major, relative difficulty)
+SUBJECTS = [
+    ('BIOL', 'Biology', 0.2), ('CHEM', 'Chemistry', 0.4), ('PHYS', 'Physics', 0.5),
+    ('MATH', 'Mathematics', 0.4), ('CHDV', 'Child Development', -0.1), ('ENGL', 'English', 0.0),
+    ('HIST', 'History', -0.1), ('PSYC', 'Psychology', 0.0), ('BUSI', 'Business', 0.1),
+    ('CSCI', 'Computer Science', 0.3), ('NURS', 'Nursing', 0.3), ('SPAN', 'Spanish', 0.0),
+]
+GRADES = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'D', 'F', 'W']
+# (class_days, printed days, meetings per week)
+MEETING_PATTERNS = [('M W F', 'MWF', 3), ('T Th', 'TTh', 2), ('M W', 'MW', 2), ('F', 'F', 1)]
+START_TIMES = [800, 900, 1000, 1100, 1230, 1330, 1430, 1530, 1800]
+MEETING_SLOTS = [(pattern, start) for pattern in MEETING_PATTERNS for start in START_TIMES]
+MINUTES_PER_WEEK = 150
+BUILDINGS = ['SCI', 'CHEM', 'EDU', 'HUM', 'BUS', 'TECH']
+
+SCHEDULE_HEADER = ['term', 'course_code', 'print_daytime', 'building_number', 'room_number',
+                   'class_days', 'class_start_time', 'class_end_time']
+
+
+def terms_for_years(first_year, years):
+    """Spring (YYYY01) and fall (YYYY08) terms, matching the sample data."""
+    return [year * 100 + month for year in range(first_year, first_year + years) for month in (1, 8)]
+
+
+def _format_time(hhmm):
+    hour, minute = divmod(hhmm, 100)
+    suffix = 'am' if hour < 12 else 'pm'
+    return f"{(hour - 1) % 12 + 1}:{minute:02d}{suffix}"
+
+
+def _add_minutes(hhmm, minutes):
+    total = (hhmm // 100) * 60 + hhmm % 100 + minutes
+    return (total // 60) * 100 + total % 60
+
+
+class SyntheticAcademicData:
+    """
+    Builds a course catalogue, per-term section offerings, students with a latent
+    ability, and their grade histories. Grades follow a normal model of student
+    ability minus course difficulty, so pass rates vary realistically by course
+    and subject. The same seed always produces the same dataset.
+    """
+
+    def __init__(self, students=50000, years=10, first_year=None, courses_per_subject=25,
+                 sections_per_offering=2, offer_rate=0.6, courses_per_term=(3, 5), seed=42):
+        self.rng = random.Random(seed)
+        self.students = students
+        self.terms = terms_for_years(first_year or 2025 - years, years)
+        self.courses_per_term = courses_per_term
+        self.courses = self._build_courses(courses_per_subject)
+        self.sections = self._build_sections(sections_per_offering, offer_rate)
+
+    def _build_courses(self, courses_per_subject):
+        courses = []
+        for prefix, _, difficulty in SUBJECTS:
+            numbers = self.rng.sample(range(100, 300), courses_per_subject)
+            for number in sorted(numbers):
+                courses.append({
+                    'course_code': f'{prefix} P{number}',
+                    'subject': prefix,
+                    'credits': self.rng.choice([3.0, 3.0, 4.0, 4.0, 5.0]),
+                    'difficulty': difficulty + (number - 100) / 400 + self.rng.gauss(0, 0.25),
+                })
+        return courses
+
+    def _build_sections(self, sections_per_offering, offer_rate):
+        sections = {}
+        for term in self.terms:
+            offered = []
+            for course in self.courses:
+                if self.rng.random() > offer_rate:
+                    continue
+                slots = self.rng.sample(MEETING_SLOTS, self.rng.randint(1, sections_per_offering))
+                for (class_days, printed_days, meetings), start in slots:
+                    end = _add_minutes(start, MINUTES_PER_WEEK // meetings)
+                    offered.append([
+                        term, course['course_code'],
+                        f'{printed_days} {_format_time(start)}-{_format_time(end)}',
+                        self.rng.choice(BUILDINGS), str(self.rng.randint(100, 399)),
+                        class_days, f'{start:04d}', f'{end:04d}',
+                    ])
+            sections[term] = offered
+        return sections
+
+    def _grade(self, ability, difficulty):
+        score = ability - difficulty + self.rng.gauss(0, 0.8)
+        if self.rng.random() < 0.03:
+            return 'W'
+        thresholds = [1.5, 1.2, 0.9, 0.6, 0.3, 0.0, -0.3, -0.8]
+        for grade, threshold in zip(GRADES, thresholds):
+            if score >= threshold:
+                return grade
+        return 'F'
+
+    def write_csv_files(self, out_dir):
+        """
+        Write porterville-shaped student_data, student_schedule and course_schedule CSVs.
+        The last generated term is treated as the current term: its enrollments go to
+        student_schedule, all earlier terms' results go to student_data.
+
+        :return: the three CSV paths in (student_schedule, student_data, course_schedule) order
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        paths = [os.path.join(out_dir, f'porterville_{name}.csv')
+                 for name in ('student_schedule', 'student_data', 'course_schedule')]
+        current_term = self.terms[-1]
+        course_by_code = {course['course_code']: course for course in self.courses}
+        sections_by_code = {term: {} for term in self.terms}
+        offered_by_subject = {term: {} for term in self.terms}
+        for term, offered in self.sections.items():
+            for section in offered:
+                sections_by_code[term].setdefault(section[1], []).append(section)
+            for code in sections_by_code[term]:
+                offered_by_subject[term].setdefault(course_by_code[code]['subject'], []).append(code)
+
+        with open(paths[0], 'w', newline='') as schedule_file, \
+                open(paths[1], 'w', newline='') as data_file, \
+                open(paths[2], 'w', newline='') as course_file:
+            schedule_writer = csv.writer(schedule_file)
+            data_writer = csv.writer(data_file)
+            course_writer = csv.writer(course_file)
+            schedule_writer.writerow(['student_id'] + SCHEDULE_HEADER)
+            data_writer.writerow(['student_id', 'term', 'course_code', 'credits', 'grade', 'major'])
+            course_writer.writerow(SCHEDULE_HEADER)
+            for term in self.terms:
+                course_writer.writerows(self.sections[term])
+
+            width = max(3, len(str(self.students)))
+            for index in range(1, self.students + 1):
+                student_id = str(index).zfill(width)
+                prefix, major, _ = self.rng.choice(SUBJECTS)
+                ability = self.rng.gauss(1.0, 0.6)
+                start = self.rng.randrange(len(self.terms))
+                enrolled_terms = self.terms[start:start + self.rng.randint(2, 8)]
+                taken = set()
+                for term in enrolled_terms:
+                    # Roughly half of each term's load comes from the student's major
+                    count = self.rng.randint(*self.courses_per_term)
+                    in_major = offered_by_subject[term].get(prefix, [])
+                    offered = list(sections_by_code[term])
+                    candidates = self.rng.sample(in_major, min(len(in_major), count))[:count // 2 + 1]
+                    candidates += self.rng.sample(offered, min(len(offered), count + len(taken)))
+                    picks = [code for code in dict.fromkeys(candidates) if code not in taken][:count]
+                    for code in picks:
+                        taken.add(code)
+                        course = course_by_code[code]
+                        if term == current_term:
+                            schedule_writer.writerow([student_id] + self.rng.choice(sections_by_code[term][code]))
+                        else:
+                            data_writer.writerow([student_id, term, code, course['credits'],
+                                                  self._grade(ability, course['difficulty']), major])
+        return paths
+
+
+def generate_academic_db(db_name, out_dir, **options):
+    """Generate the synthetic CSVs into out_dir and load them into db_name with the streaming loader."""
+    paths = SyntheticAcademicData(**options).write_csv_files(out_dir)
+    return create_db_tables_from_csv_files(paths, db_name, ['student_schedule', 'student_data', 'course_schedule'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic academic database for load testing.')
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--courses-per-subject', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out-dir', default='synthetic_data')
+    parser.add_argument('--db', default=None, help='SQLite file to load (default: <out-dir>/porterville_academic.db)')
+    args = parser.parse_args()
+    generate_academic_db(args.db or os.path.join(args.out_dir, 'porterville_academic.db'), args.out_dir,
+                         students=args.students, years=args.years,
+                         courses_per_subject=args.courses_per_subject, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()